@@ -0,0 +1,103 @@
+import queue
+import threading
+from concurrent.futures import Future
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+# Worker configuration
+MAX_PENDING_CALLS = 64
+
+class AsyncDatabase:
+    """Run database calls on one dedicated worker thread.
+
+    submit() queues any callable (normally a database.py function) and
+    returns a concurrent.futures.Future. Optional on_success/on_error
+    callbacks are delivered on the Kivy main loop via Clock, so screens can
+    update widgets from them directly; a call that fails without an
+    on_error is logged. The queue is bounded; when it is full, submit()
+    raises RuntimeError at once rather than blocking the main loop or
+    letting work pile up without limit.
+    """
+
+    _STOP = object()
+
+    def __init__(self, max_pending=MAX_PENDING_CALLS):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        """Start the worker thread on first use"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="cpd-db-worker", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        """Worker loop: execute queued calls in order"""
+        while True:
+            item = self._queue.get()
+            try:
+                if item is self._STOP:
+                    return
+
+                future, func, args, kwargs = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(func(*args, **kwargs))
+                except BaseException as e:
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def submit(self, func, *args, on_success=None, on_error=None, **kwargs):
+        """Queue func(*args, **kwargs) and return a Future for its result"""
+        future = Future()
+        # Always attached, so fire-and-forget calls still log their errors
+        name = getattr(func, "__name__", repr(func))
+        future.add_done_callback(lambda f: self._dispatch(f, on_success, on_error, name))
+
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((future, func, args, kwargs))
+        except queue.Full:
+            raise RuntimeError("Database queue is full, try again shortly")
+        return future
+
+    def _dispatch(self, future, on_success, on_error, name):
+        """Hand a finished call's outcome to the main loop"""
+        if future.cancelled():
+            return
+
+        error = future.exception()
+        if error is None:
+            if on_success is not None:
+                result = future.result()
+                Clock.schedule_once(lambda dt: on_success(result))
+        elif on_error is not None:
+            Clock.schedule_once(lambda dt: on_error(error))
+        else:
+            Logger.error(f"CPD: Background database call {name} failed: {error}")
+
+    def pending(self):
+        """Number of calls waiting for the worker"""
+        return self._queue.qsize()
+
+    def shutdown(self, wait=True):
+        """Finish queued calls and stop the worker"""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None or not thread.is_alive():
+            return
+
+        self._queue.put(self._STOP)
+        if wait:
+            thread.join()
+
+_async_db = AsyncDatabase()
+
+def get_async_database():
+    """Return the process-wide database worker"""
+    return _async_db
@@ -1,129 +1,759 @@
 import os
+import json
+import hashlib
 import zipfile
+import threading
+import functools
 import shutil
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from database import get_entries_count, log_backup, get_last_backup_date
-from drive_upload import upload_to_drive
+import database
+from database import (snapshot_database, log_backup, get_last_backup_timestamp,
+                      get_photo_manifest, replace_photo_manifest, get_referenced_archives,
+                      restore_database_file, get_entry_photo, record_verification,
+                      delete_backup_log, get_backup_log_paths)
+from upload_outbox import queue_upload
+from scheduler import get_scheduler
 from kivy.logger import Logger
-import threading
+import time
 
 # Backup configuration
 BACKUP_INTERVAL_DAYS = 14  # 2 weeks
 BACKUP_DIR = "cpd_tracker/backups"
-DB_PATH = "cpd_tracker/cpd.db"
+BACKUP_RUN_CONDITIONS = ("idle",)  # Scheduled backups wait until the user is idle
 PHOTOS_DIR = "cpd_tracker/assets/photos"
+COPY_CHUNK_SIZE = 1024 * 1024  # Bytes read per chunk when archiving files
+
+# One backup, verification or retention pass at a time per process
+_backup_lock = threading.RLock()
+
+# Incremental backups - archives only hold new or changed photos and a
+# manifest.json that says which earlier archive holds each of the others
+BACKUP_MODE_AUTO = "auto"
+BACKUP_MODE_FULL = "full"
+BACKUP_MODE_INCREMENTAL = "incremental"
+MAX_BACKUP_CHAIN = 6  # Take a full backup once photos span this many archives
+MANIFEST_NAME = "manifest.json"
+
+# Per-file compression - photos are already compressed, so deflating them
+# again only burns CPU and battery; the database snapshot and text still shrink
+STORED_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webp", ".heic", ".heif", ".gif",
+                     ".mp4", ".zip", ".gz", ".xz"}
+DB_COMPRESSION = "deflate"  # or "lzma" / "zstd" where this Python supports them
+READ_AHEAD_BYTES = 16 * 1024 * 1024  # Photos buffered while the snapshot compresses
+
+VERIFY_WORKERS = os.cpu_count() or 2  # Threads hashing members in verify_backup()
+
+# Retention configuration - newest archive of each recent day, week and month
+RETENTION_DAILY = 7
+RETENTION_WEEKLY = 4
+RETENTION_MONTHLY = 12
+BACKUP_BUDGET_BYTES = 512 * 1024 * 1024  # Older tiers are dropped beyond this
+
+# Restore configuration
+RESTORE_MODE_FULL = "full"  # Database and every photo up front
+RESTORE_MODE_LAZY = "lazy"  # Database now, each photo when it is first needed
+
+def exclusive(func):
+    """Run func under the process-wide backup lock"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _backup_lock:
+            return func(*args, **kwargs)
+    return wrapper
 
 def ensure_backup_directory():
     """Ensure backup directory exists"""
     os.makedirs(BACKUP_DIR, exist_ok=True)
 
-def create_backup():
-    """Create a complete backup of database and photos"""
+def iter_photo_files():
+    """Yield (path, archive name) for every photo under PHOTOS_DIR"""
+    if not os.path.exists(PHOTOS_DIR):
+        return
+    for root, dirs, files in os.walk(PHOTOS_DIR):
+        dirs.sort()
+        for file in sorted(files):
+            file_path = os.path.join(root, file)
+            arcname = os.path.join("photos", os.path.relpath(file_path, PHOTOS_DIR))
+            yield file_path, arcname.replace(os.sep, "/")
+
+def resolve_compression(name):
+    """Map a compression name to a zipfile method, falling back to deflate"""
+    if name == "deflate":
+        return zipfile.ZIP_DEFLATED
+    if name == "lzma":
+        try:
+            import lzma  # Not every Android Python build ships it
+            return zipfile.ZIP_LZMA
+        except ImportError:
+            pass
+    elif name == "zstd":
+        method = getattr(zipfile, "ZIP_ZSTANDARD", None)
+        if method is not None:
+            return method
+    
+    Logger.warning(f"CPD: {name} compression not available, using deflate")
+    return zipfile.ZIP_DEFLATED
+
+def compression_for(arcname):
+    """Pick the compression method for one archive member"""
+    extension = os.path.splitext(arcname)[1].lower()
+    if extension in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    if arcname == "cpd.db":
+        return resolve_compression(DB_COMPRESSION)
+    return zipfile.ZIP_DEFLATED
+
+def add_file_to_zip(zipf, file_path, arcname, compress_type=None):
+    """Stream one file into an open archive in COPY_CHUNK_SIZE chunks.
+
+    compress_type defaults to compression_for(arcname). Returns the SHA-256
+    hex digest of the file, computed on the same pass.
+    """
+    info = zipfile.ZipInfo.from_file(file_path, arcname)
+    info.compress_type = compress_type if compress_type is not None else compression_for(arcname)
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as src, zipf.open(info, "w") as dst:
+        while True:
+            chunk = src.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            dst.write(chunk)
+    return digest.hexdigest()
+
+def add_bytes_to_zip(zipf, file_path, arcname, data):
+    """Write a file already read into memory; returns its SHA-256 hex digest"""
+    info = zipfile.ZipInfo.from_file(file_path, arcname)
+    info.compress_type = compression_for(arcname)
+    zipf.writestr(info, data)
+    return hashlib.sha256(data).hexdigest()
+
+def read_ahead(items, job, budget=None):
+    """Read (path, arcname, stat) items into memory until job finishes.
+
+    Stops early once budget (default READ_AHEAD_BYTES) bytes are buffered.
+    Returns the contents of the leading items that were read.
+    """
+    if budget is None:
+        budget = READ_AHEAD_BYTES
+    buffered = []
+    used = 0
+    for file_path, arcname, stat in items:
+        if job.done() or used + stat.st_size > budget:
+            break
+        with open(file_path, "rb") as f:
+            data = f.read()
+        buffered.append(data)
+        used += len(data)
+    return buffered
+
+def read_backup_manifest(zipf):
+    """Return an archive's manifest, or None for pre-manifest full backups"""
+    try:
+        return json.loads(zipf.read(MANIFEST_NAME))
+    except KeyError:
+        return None
+
+def choose_backup_mode(manifest):
+    """Pick full or incremental for the next backup given the photo manifest"""
+    if not manifest:
+        return BACKUP_MODE_FULL
+    
+    archives = {row[3] for row in manifest.values()}
+    if len(archives) >= MAX_BACKUP_CHAIN:
+        return BACKUP_MODE_FULL
+    
+    # A chain with a missing link cannot be restored, so start a new one
+    for archive in archives:
+        if not os.path.exists(os.path.join(BACKUP_DIR, archive)):
+            return BACKUP_MODE_FULL
+    return BACKUP_MODE_INCREMENTAL
+
+def reserve_archive_path(timestamp):
+    """Claim an unused backup_<timestamp>[_n].zip path for a new archive.
+
+    The claim is an O_EXCL create of its .partial file, so two backups
+    started in the same second never write the same archive. The caller
+    owns (and must remove or rename) the .partial file.
+    """
+    suffix = 0
+    while True:
+        name = f"backup_{timestamp}_{suffix}.zip" if suffix else f"backup_{timestamp}.zip"
+        zip_path = os.path.join(BACKUP_DIR, name)
+        suffix += 1
+        # Never overwrite an archive a chain may depend on
+        if os.path.exists(zip_path):
+            continue
+        try:
+            os.close(os.open(f"{zip_path}.partial", os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            continue
+        if os.path.exists(zip_path):
+            # Finished by another backup between the two checks
+            os.remove(f"{zip_path}.partial")
+            continue
+        return zip_path
+
+@exclusive
+def create_backup(mode=BACKUP_MODE_AUTO, commit_manifest=True):
+    """Create a backup of the database and photos.
+
+    A full backup archives every photo; an incremental one archives only
+    photos whose size or modification time changed since the manifest was
+    last written, and references earlier archives for the rest. The
+    default auto mode picks between them with choose_backup_mode(). With
+    commit_manifest=False the photo manifest is left for
+    commit_backup_manifest() to update once the archive has verified.
+    """
     try:
         ensure_backup_directory()
         
+        known_photos = get_photo_manifest()
+        if mode == BACKUP_MODE_AUTO:
+            mode = choose_backup_mode(known_photos)
+        
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_folder = os.path.join(BACKUP_DIR, f"backup_{timestamp}")
-        os.makedirs(backup_folder, exist_ok=True)
-        
-        # Copy database
-        if os.path.exists(DB_PATH):
-            db_dst = os.path.join(backup_folder, "cpd.db")
-            shutil.copy2(DB_PATH, db_dst)
-            Logger.info("CPD: Database copied to backup")
-        
-        # Copy photos
-        photos_backup_dir = os.path.join(backup_folder, "photos")
-        if os.path.exists(PHOTOS_DIR):
-            shutil.copytree(PHOTOS_DIR, photos_backup_dir, dirs_exist_ok=True)
-            Logger.info("CPD: Photos copied to backup")
-        else:
-            os.makedirs(photos_backup_dir, exist_ok=True)
-        
-        # Create zip file
-        zip_path = f"{backup_folder}.zip"
-        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(backup_folder):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    arcname = os.path.relpath(file_path, backup_folder)
-                    zipf.write(file_path, arcname)
-        
-        # Clean up temporary folder
-        shutil.rmtree(backup_folder)
-        
-        # Get entries count for logging
-        entries_count = get_entries_count()
-        
-        Logger.info(f"CPD: Backup created successfully: {zip_path}")
+        zip_path = reserve_archive_path(timestamp)
+        archive_name = os.path.basename(zip_path)
+        partial_path = f"{zip_path}.partial"
+        snapshot_path = f"{zip_path}.db"
+        
+        try:
+            # Snapshot database - consistent even while the app keeps writing
+            entries_count = snapshot_database(snapshot_path)
+            
+            # Decide which photos go into this archive from stat() alone
+            photos = {}
+            to_archive = []
+            for file_path, arcname in iter_photo_files():
+                stat = os.stat(file_path)
+                known = known_photos.get(arcname)
+                if (mode == BACKUP_MODE_INCREMENTAL and known is not None
+                        and known[0] == stat.st_size and known[1] == stat.st_mtime_ns):
+                    photos[arcname] = known
+                    continue
+                to_archive.append((file_path, arcname, stat))
+            
+            # Stream the snapshot and photos straight into the archive
+            with zipfile.ZipFile(partial_path, "w", zipfile.ZIP_DEFLATED) as zipf:
+                # zipfile allows one member writer at a time, so the snapshot
+                # compresses on a worker thread while the photos are read ahead
+                with ThreadPoolExecutor(max_workers=1) as pool:
+                    db_job = pool.submit(add_file_to_zip, zipf, snapshot_path, "cpd.db")
+                    buffered = read_ahead(to_archive, db_job)
+                    members = {"cpd.db": db_job.result()}
+                
+                for index, (file_path, arcname, stat) in enumerate(to_archive):
+                    if index < len(buffered):
+                        digest = add_bytes_to_zip(zipf, file_path, arcname, buffered[index])
+                        buffered[index] = None
+                    else:
+                        digest = add_file_to_zip(zipf, file_path, arcname)
+                    photos[arcname] = (stat.st_size, stat.st_mtime_ns, digest, archive_name)
+                    members[arcname] = digest
+                
+                zipf.writestr(MANIFEST_NAME, json.dumps({
+                    "format": 2,
+                    "kind": mode,
+                    "archive": archive_name,
+                    "created": timestamp,
+                    "photos": {
+                        path: {"size": row[0], "mtime_ns": row[1], "sha256": row[2], "archive": row[3]}
+                        for path, row in photos.items()
+                    },
+                    "members": members
+                }, indent=1))
+            
+            # Only a finished archive ever carries the backup_*.zip name
+            os.replace(partial_path, zip_path)
+        finally:
+            for leftover in (snapshot_path, partial_path):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        
+        if commit_manifest:
+            replace_photo_manifest(photos)
+        
+        Logger.info(f"CPD: {mode.capitalize()} backup created successfully: {zip_path} "
+                    f"({len(to_archive)} of {len(photos)} photos archived)")
         return zip_path, entries_count
         
     except Exception as e:
         Logger.error(f"CPD: Error creating backup: {e}")
         raise
 
-def upload_backup_to_drive(zip_path):
-    """Upload backup to Google Drive"""
+def commit_backup_manifest(zip_path):
+    """Make zip_path's photo manifest the one the next backup builds on"""
+    with zipfile.ZipFile(zip_path) as zipf:
+        manifest = read_backup_manifest(zipf)
+    replace_photo_manifest({
+        path: (row["size"], row["mtime_ns"], row["sha256"], row["archive"])
+        for path, row in manifest["photos"].items()
+    })
+
+def quarantine_backup(zip_path):
+    """Move an archive that failed verification aside; returns its new path.
+
+    The .failed name keeps it out of chains, retention and restores. Only
+    the newest failed archive is kept, for diagnosis.
+    """
+    for name in os.listdir(BACKUP_DIR):
+        if name.endswith(".zip.failed"):
+            os.remove(os.path.join(BACKUP_DIR, name))
+    failed_path = f"{zip_path}.failed"
+    os.replace(zip_path, failed_path)
+    Logger.warning(f"CPD: Moved unverifiable backup aside: {failed_path}")
+    return failed_path
+
+def hash_members(zip_path, names):
+    """SHA-256 each named member through a private handle on the archive.
+
+    Returns {name: (hex digest, None)} or {name: (None, error)}; reading a
+    member to the end also checks its zip CRC.
+    """
+    results = {}
+    with zipfile.ZipFile(zip_path) as zipf:
+        for name in names:
+            digest = hashlib.sha256()
+            try:
+                with zipf.open(name) as src:
+                    for chunk in iter(lambda: src.read(COPY_CHUNK_SIZE), b""):
+                        digest.update(chunk)
+                results[name] = (digest.hexdigest(), None)
+            except Exception as e:
+                results[name] = (None, str(e))
+    return results
+
+def check_archived_database(zip_path):
+    """Run PRAGMA integrity_check on the cpd.db inside an archive"""
+    temp_path = f"{zip_path}.verify.db"
     try:
-        upload_to_drive(zip_path)
-        Logger.info(f"CPD: Backup uploaded to Google Drive: {zip_path}")
-        return True
+        with zipfile.ZipFile(zip_path) as zipf:
+            extract_member(zipf, "cpd.db", temp_path)
+        conn = sqlite3.connect(temp_path)
+        try:
+            rows = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+        finally:
+            conn.close()
+        return [] if rows == ["ok"] else [f"cpd.db: {row}" for row in rows]
     except Exception as e:
-        Logger.error(f"CPD: Error uploading backup to Google Drive: {e}")
-        return False
+        return [f"cpd.db: {e}"]
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
 
-def cleanup_old_backups(keep_count=10):
-    """Clean up old local backup files, keeping only the most recent ones"""
+def verify_backup(zip_path, max_workers=None, record=True):
+    """Check that a backup archive can be read back intact.
+
+    Every member is re-hashed and compared with the SHA-256 listed in the
+    manifest (older archives without checksums get a CRC-only check), spread
+    over up to max_workers threads - hashlib and zlib release the GIL, so
+    members are checked on several cores. The embedded database gets PRAGMA
+    integrity_check alongside. With record set, the outcome and duration are
+    stored on the archive's backup_log row. Returns (ok, problems).
+    """
+    started = time.monotonic()
+    problems = []
     try:
-        if not os.path.exists(BACKUP_DIR):
-            return
+        with zipfile.ZipFile(zip_path) as zipf:
+            manifest = read_backup_manifest(zipf)
+            sizes = {info.filename: info.file_size for info in zipf.infolist()}
+        
+        expected = (manifest or {}).get("members")
+        if expected is None:
+            expected = {name: None for name in sizes if name != MANIFEST_NAME}
+        problems.extend(f"{name}: missing from archive" for name in sorted(set(expected) - set(sizes)))
         
-        # Get all backup files
-        backup_files = [f for f in os.listdir(BACKUP_DIR) if f.startswith("backup_") and f.endswith(".zip")]
-        backup_files.sort(reverse=True)  # Most recent first
+        # Biggest members first, dealt round-robin so the workers finish together
+        names = sorted((name for name in expected if name in sizes), key=sizes.get, reverse=True)
+        workers = max(1, min(max_workers or VERIFY_WORKERS, len(names)))
+        groups = [names[i::workers] for i in range(workers)]
         
-        # Remove old backups
-        for backup_file in backup_files[keep_count:]:
-            backup_path = os.path.join(BACKUP_DIR, backup_file)
+        with ThreadPoolExecutor(max_workers=workers + 1) as pool:
+            db_job = pool.submit(check_archived_database, zip_path) if "cpd.db" in sizes else None
+            for results in pool.map(lambda group: hash_members(zip_path, group), groups):
+                for name, (digest, error) in results.items():
+                    if error is not None:
+                        problems.append(f"{name}: {error}")
+                    elif expected[name] is not None and digest != expected[name]:
+                        problems.append(f"{name}: checksum mismatch")
+            if db_job is not None:
+                problems.extend(db_job.result())
+            else:
+                problems.append("cpd.db: missing from archive")
+    except Exception as e:
+        problems.append(str(e))
+    
+    seconds = time.monotonic() - started
+    ok = not problems
+    if record:
+        record_verification(zip_path, "ok" if ok else "failed", seconds)
+    
+    if ok:
+        Logger.info(f"CPD: Backup verified in {seconds:.2f}s: {zip_path}")
+    else:
+        Logger.error(f"CPD: Backup verification failed for {zip_path}: {'; '.join(problems)}")
+    return ok, problems
+
+def photo_sources(zip_path):
+    """Map each photo in a backup to the archive that holds it.
+
+    Follows the manifest of zip_path through the chain in its folder;
+    archives written before manifests existed are self-contained.
+    """
+    backup_dir = os.path.dirname(zip_path)
+    with zipfile.ZipFile(zip_path) as zipf:
+        manifest = read_backup_manifest(zipf)
+        if manifest is None:
+            return {name: zip_path for name in zipf.namelist() if name.startswith("photos/")}
+    return {path: os.path.join(backup_dir, info["archive"]) for path, info in manifest["photos"].items()}
+
+def group_by_archive(sources):
+    """Invert photo_sources() to {archive path: [photo arcnames]}"""
+    by_archive = {}
+    for path, archive_path in sources.items():
+        by_archive.setdefault(archive_path, []).append(path)
+    for archive_path in by_archive:
+        if not os.path.exists(archive_path):
+            raise FileNotFoundError(f"Backup chain is missing archive: {os.path.basename(archive_path)}")
+    return by_archive
+
+def extract_member(zipf, arcname, dest_path):
+    """Stream one archive member to dest_path, replacing it atomically"""
+    directory = os.path.dirname(dest_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    
+    temp_path = dest_path + ".partial"
+    try:
+        # getinfo() is a lookup in the central directory; only this member is read
+        with zipf.open(zipf.getinfo(arcname)) as src, open(temp_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+        os.replace(temp_path, dest_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def rebuild_from_chain(zip_path, dest_dir):
+    """Rebuild the database and full photo set from a backup chain.
+
+    Extracts cpd.db from zip_path and every photo its manifest lists from
+    whichever archive (in the same folder) holds it. Returns the number of
+    photos restored.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    with zipfile.ZipFile(zip_path) as latest:
+        latest.extract("cpd.db", dest_dir)
+    
+    # Open each archive in the chain once and pull its photos out
+    by_archive = group_by_archive(photo_sources(zip_path))
+    for archive_path, paths in by_archive.items():
+        with zipfile.ZipFile(archive_path) as zipf:
+            zipf.extractall(dest_dir, paths)
+    
+    photos_count = sum(len(paths) for paths in by_archive.values())
+    Logger.info(f"CPD: Rebuilt {photos_count} photos from {len(by_archive)} archives")
+    return photos_count
+
+# Archive a lazy restore reads photos from until the next restore
+_restore_source = None
+
+def photo_arcname(photo_path):
+    """Archive member name for a photo path as stored on an entry"""
+    relative = os.path.relpath(os.path.abspath(photo_path), os.path.abspath(PHOTOS_DIR))
+    if relative.startswith(os.pardir):
+        relative = os.path.basename(photo_path)
+    return "photos/" + relative.replace(os.sep, "/")
+
+def photo_destination(arcname):
+    """Local path for a photos/ member, refusing names that escape PHOTOS_DIR"""
+    root = os.path.abspath(PHOTOS_DIR)
+    dest_path = os.path.abspath(os.path.join(root, arcname[len("photos/"):]))
+    if os.path.commonpath([root, dest_path]) != root:
+        raise ValueError(f"Unsafe path in backup archive: {arcname}")
+    return dest_path
+
+def latest_backup():
+    """Path of the newest archive in BACKUP_DIR, or None"""
+    if not os.path.exists(BACKUP_DIR):
+        return None
+    names = sorted(name for name in os.listdir(BACKUP_DIR)
+                   if name.startswith("backup_") and name.endswith(".zip"))
+    return os.path.join(BACKUP_DIR, names[-1]) if names else None
+
+@exclusive
+def restore_backup(zip_path, mode=RESTORE_MODE_LAZY):
+    """Restore the database (and optionally photos) from a backup archive.
+
+    cpd.db is streamed next to the live database, checked, and renamed over
+    it, so a failed restore leaves the current database untouched. In full
+    mode every photo in the chain is extracted into PHOTOS_DIR; in lazy
+    mode photos are left in the archives and restore_photo() extracts each
+    one when it is needed. Returns (entries_count, photos_restored).
+    """
+    global _restore_source
+    if mode not in (RESTORE_MODE_FULL, RESTORE_MODE_LAZY):
+        raise ValueError(f"Unknown restore mode: {mode}")
+    
+    temp_path = database.DB_PATH + ".restore"
+    try:
+        with zipfile.ZipFile(zip_path) as zipf:
+            extract_member(zipf, "cpd.db", temp_path)
+        
+        conn = sqlite3.connect(temp_path)
+        try:
+            check = conn.execute("PRAGMA quick_check").fetchone()[0]
+        finally:
+            conn.close()
+        if check != "ok":
+            raise ValueError(f"Backup database is damaged: {check}")
+        
+        entries_count = restore_database_file(temp_path)
+        _restore_source = zip_path
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        Logger.error(f"CPD: Restore from {zip_path} failed: {e}")
+        raise
+    
+    photos_restored = 0
+    if mode == RESTORE_MODE_FULL:
+        for archive_path, paths in group_by_archive(photo_sources(zip_path)).items():
+            with zipfile.ZipFile(archive_path) as zipf:
+                for arcname in paths:
+                    extract_member(zipf, arcname, photo_destination(arcname))
+                    photos_restored += 1
+    
+    Logger.info(f"CPD: Restored {entries_count} entries and {photos_restored} photos from {zip_path} ({mode})")
+    return entries_count, photos_restored
+
+def restore_photo(photo_path, zip_path=None, overwrite=False):
+    """Extract a single photo from the backup chain without unpacking the rest.
+
+    zip_path defaults to the archive of the last restore, then to the newest
+    backup. An existing file is kept unless overwrite is set. Returns the
+    local path, or None when no backup holds the photo.
+    """
+    if not overwrite and os.path.exists(photo_path):
+        return photo_path
+    
+    zip_path = zip_path or _restore_source or latest_backup()
+    if zip_path is None:
+        return None
+    
+    arcname = photo_arcname(photo_path)
+    archive_path = photo_sources(zip_path).get(arcname)
+    if archive_path is None:
+        Logger.warning(f"CPD: {arcname} is not in backup {os.path.basename(zip_path)}")
+        return None
+    
+    with zipfile.ZipFile(archive_path) as zipf:
+        extract_member(zipf, arcname, photo_path)
+    Logger.info(f"CPD: Restored {arcname} from {os.path.basename(archive_path)}")
+    return photo_path
+
+def restore_entry_photo(entry_id, zip_path=None):
+    """Restore the photo attached to one entry; returns its path or None"""
+    photo_path = get_entry_photo(entry_id)
+    if not photo_path:
+        return None
+    return restore_photo(photo_path, zip_path, overwrite=True)
+
+def upload_backup_to_drive(zip_path):
+    """Queue a backup for upload to Google Drive through the outbox"""
+    try:
+        queue_upload(zip_path)
+        return True
+    except Exception as e:
+        Logger.error(f"CPD: Error queuing backup for Google Drive: {e}")
+        return False
+
+def scan_backups():
+    """One scandir pass over BACKUP_DIR: [(name, size, datetime)] newest first.
+
+    The time comes from the backup_YYYYmmdd_HHMMSS name, falling back to
+    the file's modification time for names that do not parse.
+    """
+    archives = []
+    if not os.path.exists(BACKUP_DIR):
+        return archives
+    with os.scandir(BACKUP_DIR) as entries:
+        for entry in entries:
+            if not (entry.name.startswith("backup_") and entry.name.endswith(".zip")):
+                continue
+            stat = entry.stat()
             try:
-                os.remove(backup_path)
-                Logger.info(f"CPD: Removed old backup: {backup_file}")
-            except Exception as e:
-                Logger.warning(f"CPD: Could not remove backup {backup_file}: {e}")
-                
+                created = datetime.strptime(entry.name[len("backup_"):][:15], "%Y%m%d_%H%M%S")
+            except ValueError:
+                created = datetime.fromtimestamp(stat.st_mtime)
+            archives.append((entry.name, stat.st_size, created))
+    archives.sort(key=lambda archive: (archive[2], archive[0]), reverse=True)
+    return archives
+
+def plan_retention(archives, protected=(), daily=RETENTION_DAILY, weekly=RETENTION_WEEKLY,
+                   monthly=RETENTION_MONTHLY, budget_bytes=BACKUP_BUDGET_BYTES):
+    """Choose which archives to keep under a grandfather-father-son policy.
+
+    archives is scan_backups() output. The newest archive of each of the
+    last daily days, weekly ISO weeks and monthly months is kept, as are the
+    newest archive overall and every name in protected. If the kept set is
+    over budget_bytes, unprotected archives are dropped oldest first.
+    Returns (keep, delete) as lists of names, newest first.
+    """
+    tiers = [(daily, lambda created: created.date()),
+             (weekly, lambda created: created.isocalendar()[:2]),
+             (monthly, lambda created: (created.year, created.month))]
+    
+    keep = set(protected)
+    if archives:
+        keep.add(archives[0][0])
+    for limit, bucket_of in tiers:
+        seen = set()
+        for name, _, created in archives:
+            bucket = bucket_of(created)
+            if bucket in seen:
+                continue
+            if len(seen) == limit:
+                break
+            seen.add(bucket)
+            keep.add(name)
+    
+    # Over budget: shed the oldest tier members that nothing depends on
+    sizes = {name: size for name, size, _ in archives}
+    total = sum(sizes[name] for name in keep if name in sizes)
+    sheddable = [name for name, _, _ in reversed(archives)
+                 if name in keep and name not in protected and name != archives[0][0]]
+    for name in sheddable:
+        if total <= budget_bytes:
+            break
+        keep.discard(name)
+        total -= sizes[name]
+    
+    ordered = [name for name, _, _ in archives]
+    return [name for name in ordered if name in keep], [name for name in ordered if name not in keep]
+
+def chain_dependencies(names):
+    """Archives the photo manifests of the named archives point into"""
+    needed = set()
+    for name in names:
+        try:
+            with zipfile.ZipFile(os.path.join(BACKUP_DIR, name)) as zipf:
+                manifest = read_backup_manifest(zipf)
+        except (OSError, zipfile.BadZipFile):
+            continue
+        if manifest is not None:
+            needed.update(info["archive"] for info in manifest["photos"].values())
+    return needed
+
+@exclusive
+def apply_retention(daily=RETENTION_DAILY, weekly=RETENTION_WEEKLY, monthly=RETENTION_MONTHLY,
+                    budget_bytes=BACKUP_BUDGET_BYTES, dry_run=False):
+    """Delete backups outside the retention policy and prune backup_log.
+
+    Archives the current photo set still references are never deleted, and
+    neither is any archive a kept incremental backup needs for a restore.
+    backup_log keeps rows only for archives still in BACKUP_DIR (including
+    the .failed archive quarantine_backup() keeps), so rows of archives
+    removed earlier or by hand go as well. Returns a report dict: deleted
+    names, kept count, bytes_reclaimed, bytes_kept and log_rows_deleted
+    (all zero deletions with dry_run).
+    """
+    archives = scan_backups()
+    sizes = {name: size for name, size, _ in archives}
+    referenced = get_referenced_archives()
+    
+    keep, delete = plan_retention(archives, referenced, daily, weekly, monthly, budget_bytes)
+    needed = chain_dependencies(keep) - set(keep)
+    delete = [name for name in delete if name not in needed]
+    
+    deleted = []
+    if not dry_run:
+        for name in delete:
+            try:
+                os.remove(os.path.join(BACKUP_DIR, name))
+                deleted.append(name)
+            except OSError as e:
+                Logger.warning(f"CPD: Could not remove backup {name}: {e}")
+    else:
+        deleted = delete
+    
+    log_rows_deleted = 0
+    if not dry_run:
+        # Also drop rows of archives that were already gone before this run
+        present = {os.path.join(BACKUP_DIR, name) for name, _, _ in archives if name not in deleted}
+        orphaned = [path for path in get_backup_log_paths() if path not in present
+                    and not (path.endswith(".zip.failed") and os.path.exists(path))]
+        log_rows_deleted = delete_backup_log(orphaned)
+    bytes_reclaimed = sum(sizes[name] for name in deleted)
+    report = {
+        "deleted": deleted,
+        "kept": len(archives) - len(deleted),
+        "bytes_reclaimed": bytes_reclaimed,
+        "bytes_kept": sum(sizes.values()) - bytes_reclaimed,
+        "log_rows_deleted": log_rows_deleted,
+    }
+    Logger.info(f"CPD: Retention {'would remove' if dry_run else 'removed'} {len(deleted)} backups, "
+                f"{bytes_reclaimed / (1024 * 1024):.1f} MB reclaimed, {report['kept']} kept")
+    return report
+
+def cleanup_old_backups(**policy):
+    """Apply the retention policy to local backups; returns its report or None"""
+    try:
+        return apply_retention(**policy)
     except Exception as e:
         Logger.error(f"CPD: Error cleaning up old backups: {e}")
+        return None
+
+def next_backup_due():
+    """Epoch time the next scheduled backup is due (0 if there never was one)"""
+    last_backup = get_last_backup_timestamp()
+    if last_backup is None:
+        return 0
+    return last_backup + BACKUP_INTERVAL_DAYS * 86400
 
 def is_backup_needed():
     """Check if backup is needed based on last backup date"""
     try:
-        last_backup = get_last_backup_date()
-        if not last_backup:
-            return True
-        
-        last_backup_date = datetime.strptime(last_backup, "%Y-%m-%d %H:%M:%S")
-        days_since_backup = (datetime.now() - last_backup_date).days
-        
-        return days_since_backup >= BACKUP_INTERVAL_DAYS
+        # Served from memory; only a finished backup makes this hit the database
+        return time.time() >= next_backup_due()
         
     except Exception as e:
         Logger.error(f"CPD: Error checking backup need: {e}")
         return True  # Default to backup needed if error
 
-def perform_backup():
+@exclusive
+def perform_backup(mode=BACKUP_MODE_AUTO):
     """Perform complete backup process"""
     try:
         Logger.info("CPD: Starting backup process")
         
         # Create backup
-        zip_path, entries_count = create_backup()
+        if mode == BACKUP_MODE_AUTO:
+            mode = choose_backup_mode(get_photo_manifest())
+        zip_path, entries_count = create_backup(mode, commit_manifest=False)
+        
+        # Never upload, count or build on an archive that cannot be read back;
+        # the photo manifest still points at the last good archives
+        started = time.monotonic()
+        verified, problems = verify_backup(zip_path, record=False)
+        verify_seconds = time.monotonic() - started
+        if not verified:
+            failed_path = quarantine_backup(zip_path)
+            log_backup(failed_path, entries_count, "verify_failed", mode)
+            record_verification(failed_path, "failed", verify_seconds)
+            return False, "Backup failed verification"
+        commit_backup_manifest(zip_path)
         
-        # Try to upload to Google Drive
+        # Queue for Google Drive; the outbox retries until it gets through
         upload_success = upload_backup_to_drive(zip_path)
         status = "completed" if upload_success else "local_only"
         
         # Log backup
-        log_backup(zip_path, entries_count, status)
+        log_backup(zip_path, entries_count, status, mode)
+        record_verification(zip_path, "ok", verify_seconds)
         
         # Clean up old backups
         cleanup_old_backups()
@@ -135,28 +765,29 @@ def perform_backup():
         Logger.error(f"CPD: Backup process failed: {e}")
         return False, str(e)
 
+def run_scheduled_backup():
+    """Scheduler job: back up if a backup is still due when the job runs"""
+    if not is_backup_needed():
+        Logger.info("CPD: Backup no longer needed, skipping")
+        return
+    
+    success, status = perform_backup()
+    if success:
+        Logger.info(f"CPD: Background backup completed: {status}")
+    else:
+        Logger.error(f"CPD: Background backup failed: {status}")
+
 def schedule_backup():
-    """Check if backup is needed and perform it in background if necessary"""
+    """Check if backup is needed and hand it to the background scheduler"""
     if is_backup_needed():
-        Logger.info("CPD: Backup needed, starting background backup")
-        
-        def backup_thread():
-            try:
-                success, status = perform_backup()
-                if success:
-                    Logger.info(f"CPD: Background backup completed: {status}")
-                else:
-                    Logger.error(f"CPD: Background backup failed: {status}")
-            except Exception as e:
-                Logger.error(f"CPD: Background backup thread error: {e}")
+        Logger.info("CPD: Backup needed, scheduling background backup")
         
-        # Start backup in separate thread to avoid blocking UI
-        thread = threading.Thread(target=backup_thread, daemon=True)
-        thread.start()
+        # Single-flight: repeated saves never start a second concurrent backup
+        get_scheduler().trigger("backup", run_scheduled_backup, BACKUP_RUN_CONDITIONS)
     else:
         Logger.info("CPD: No backup needed at this time")
 
-def force_backup():
+def force_backup(mode=BACKUP_MODE_AUTO):
     """Force an immediate backup regardless of schedule"""
     Logger.info("CPD: Forcing immediate backup")
-    return perform_backup()
+    return perform_backup(mode)
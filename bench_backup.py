@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+CPD Tracker - Backup Benchmark
+Times backup.py stages against synthetic databases and photo folders
+
+Usage:
+    python bench_backup.py                      # small, medium and large datasets
+    python bench_backup.py small -o bench.json  # one dataset, JSON written to a file
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import backup
+import database
+
+# Synthetic datasets: name -> (entries, photos)
+DATASETS = {
+    "small": (1000, 100),
+    "medium": (10000, 1000),
+    "large": (100000, 5000),
+}
+PHOTO_BYTES = 64 * 1024  # Random bytes compress like camera JPEGs
+ENTRY_TYPES = ("Conference", "Workshop", "Online Course", "Reading", "Seminar")
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB (None if unknown)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def synthetic_entries(count):
+    """Yield entry dicts spread over the last few years"""
+    start = datetime(2022, 1, 1)
+    for i in range(count):
+        day = start + timedelta(days=i % 1200)
+        yield {
+            "date": day.strftime("%Y-%m-%d 09:00:00"),
+            "date_start": day.strftime("%Y-%m-%d"),
+            "date_end": (day + timedelta(days=1)).strftime("%Y-%m-%d"),
+            "name": f"Synthetic activity {i}",
+            "type": ENTRY_TYPES[i % len(ENTRY_TYPES)],
+            "description": f"Benchmark entry {i} " * 4,
+            "photo": os.path.join(backup.PHOTOS_DIR, f"cpd_photo_{i}.jpg") if i % 10 == 0 else "",
+            "points": i % 8,
+            "ocr_text": f"certificate number {i} issued to the attendee",
+        }
+
+def make_dataset(root, entries, photos, photo_bytes=PHOTO_BYTES):
+    """Point database.py/backup.py at root and fill it with synthetic data"""
+    database.set_database_path(os.path.join(root, "cpd.db"))
+    database.init_db()
+    backup.BACKUP_DIR = os.path.join(root, "backups")
+    backup.PHOTOS_DIR = os.path.join(root, "photos")
+
+    database.insert_entries(synthetic_entries(entries))
+    os.makedirs(backup.PHOTOS_DIR, exist_ok=True)
+    for i in range(photos):
+        with open(os.path.join(backup.PHOTOS_DIR, f"cpd_photo_{i}.jpg"), "wb") as f:
+            f.write(os.urandom(photo_bytes))
+
+def tree_bytes(root):
+    """Total size of the files under root"""
+    return sum(os.path.getsize(os.path.join(dirpath, name))
+               for dirpath, _, files in os.walk(root) for name in files)
+
+def timed(stages, name, func, input_bytes, output_path=None):
+    """Run func, recording seconds, MB/s over input_bytes, peak RSS and output size.
+
+    output_path is a path, or a callable mapping func's result to one.
+    """
+    started = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - started
+
+    output_bytes = None
+    if output_path is not None:
+        path = output_path(result) if callable(output_path) else output_path
+        output_bytes = tree_bytes(path) if os.path.isdir(path) else os.path.getsize(path)
+
+    stages[name] = {
+        "seconds": round(seconds, 4),
+        "mb_per_s": round(input_bytes / (1024 * 1024) / seconds, 2) if input_bytes and seconds > 0 else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "output_bytes": output_bytes,
+    }
+    return result
+
+def run_dataset(name, entries, photos, photo_bytes=PHOTO_BYTES):
+    """Build one dataset in a temporary folder and time every backup stage"""
+    root = tempfile.mkdtemp(prefix=f"cpd_bench_{name}_")
+    try:
+        make_dataset(root, entries, photos, photo_bytes)
+        database.get_connection_manager().open().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        db_bytes = os.path.getsize(database.DB_PATH)
+        photo_total = tree_bytes(backup.PHOTOS_DIR)
+        all_bytes = db_bytes + photo_total
+        stages = {}
+
+        snapshot_path = os.path.join(root, "snapshot.db")
+        timed(stages, "snapshot", lambda: database.snapshot_database(snapshot_path),
+              db_bytes, snapshot_path)
+        os.remove(snapshot_path)
+
+        full_zip, _ = timed(stages, "backup_full", lambda: backup.create_backup(backup.BACKUP_MODE_FULL),
+                            all_bytes, lambda result: result[0])
+
+        # Unchanged photos: the incremental archive holds the database only
+        timed(stages, "backup_incremental", lambda: backup.create_backup(backup.BACKUP_MODE_INCREMENTAL),
+              db_bytes, lambda result: result[0])
+
+        timed(stages, "verify", lambda: backup.verify_backup(full_zip, record=False), all_bytes)
+        timed(stages, "retention", lambda: backup.cleanup_old_backups(daily=1, weekly=0, monthly=0), None)
+
+        timed(stages, "restore_lazy", lambda: backup.restore_backup(full_zip, backup.RESTORE_MODE_LAZY),
+              db_bytes)
+        shutil.rmtree(backup.PHOTOS_DIR)
+        timed(stages, "restore_full", lambda: backup.restore_backup(full_zip, backup.RESTORE_MODE_FULL),
+              all_bytes, backup.PHOTOS_DIR)
+
+        return {
+            "dataset": name,
+            "entries": entries,
+            "photos": photos,
+            "db_bytes": db_bytes,
+            "photo_bytes": photo_total,
+            "stages": stages,
+        }
+    finally:
+        database.close_connections()
+        shutil.rmtree(root, ignore_errors=True)
+
+def run_benchmarks(names, photo_bytes=PHOTO_BYTES):
+    """Run the named datasets and return the JSON-ready report"""
+    return {
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "sqlite": sqlite3.sqlite_version,
+        "platform": sys.platform,
+        "results": [run_dataset(name, *DATASETS[name], photo_bytes=photo_bytes) for name in names],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CPD Tracker backups")
+    parser.add_argument("datasets", nargs="*",
+                        help=f"datasets to run: {', '.join(DATASETS)} (default: all)")
+    parser.add_argument("--photo-bytes", type=int, default=PHOTO_BYTES,
+                        help="size of each synthetic photo")
+    parser.add_argument("-o", "--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    unknown = [name for name in args.datasets if name not in DATASETS]
+    if unknown:
+        parser.error(f"unknown dataset: {', '.join(unknown)}")
+
+    report = json.dumps(run_benchmarks(args.datasets or list(DATASETS), args.photo_bytes), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+        print(f"Benchmark report written to {args.output}")
+    else:
+        print(report)
+
+if __name__ == "__main__":
+    main()
@@ -85,7 +85,8 @@ def create_deployment_package():
     # Copy source code files
     print(f"\n📄 Copying source code files...")
     source_files = [
-        "main.py", "cpd.kv", "database.py", "backup.py", "drive_upload.py",
+        "main.py", "cpd.kv", "database.py", "async_database.py", "scheduler.py",
+        "backup.py", "drive_upload.py", "upload_outbox.py",
         "requirements.txt", "buildozer.spec", "__Setup.md", 
         "OCR_FEATURE_GUIDE.md"
     ]
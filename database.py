@@ -1,83 +1,621 @@
 import sqlite3
 import os
-from datetime import datetime
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime
 from kivy.logger import Logger
 
 # Database configuration
 DB_DIR = "cpd_tracker"
 DB_PATH = os.path.join(DB_DIR, "cpd.db")
 
-def ensure_directory():
-    """Ensure the database directory exists"""
-    os.makedirs(DB_DIR, exist_ok=True)
+# Connection tuning - WAL lets the backup/sync threads read while the UI writes
+BUSY_TIMEOUT_SECONDS = 5.0
+CACHE_SIZE_KB = 8192
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA cache_size=-{CACHE_SIZE_KB}",
+    "PRAGMA temp_store=MEMORY",
+)
 
-def init_db():
-    """Initialize the database with proper schema"""
-    ensure_directory()
-    
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        # Create the main table
-        c.execute("""CREATE TABLE IF NOT EXISTS cpd_entries (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date_created TEXT NOT NULL,
-            date_start TEXT NOT NULL,
-            date_end TEXT NOT NULL,
-            name TEXT NOT NULL,
-            type TEXT NOT NULL,
-            description TEXT NOT NULL,
-            photo TEXT,
-            points INTEGER DEFAULT 0,
-            created_timestamp REAL DEFAULT (julianday('now'))
-        )""")
+# Read cache - number of query results kept in memory
+CACHE_MAX_ENTRIES = 128
+
+# Bulk import - rows sent to executemany() per batch by insert_entries()
+DEFAULT_BATCH_SIZE = 500
+
+class QueryCache:
+    """Bounded LRU cache of read-query results.
+
+    Each result is tagged with the tables it was read from and is dropped
+    when a committed write touches one of them. Per-table generation
+    counters stop a read that raced a write from caching stale rows.
+    Values must be immutable (tuples), since every caller shares them.
+    """
+
+    def __init__(self, maxsize=CACHE_MAX_ENTRIES):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def _snapshot(self, tables):
+        return (self._epoch,) + tuple(self._generations.get(table, 0) for table in tables)
+
+    def get_or_load(self, key, tables, loader):
+        """Return the cached result for key, calling loader() on a miss"""
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+            snapshot = self._snapshot(tables)
+        
+        value = loader()
+        
+        with self._lock:
+            if self.maxsize > 0 and snapshot == self._snapshot(tables):
+                self._entries[key] = (frozenset(tables), value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, tables=None):
+        """Drop results read from any of tables (all results if None)"""
+        with self._lock:
+            if tables is None:
+                self._epoch += 1
+                self._entries.clear()
+                return
+            
+            tables = frozenset(tables)
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+            stale = [key for key, (read_from, _) in self._entries.items() if read_from & tables]
+            for key in stale:
+                del self._entries[key]
+
+    def stats(self):
+        """Hit/miss counters for profiling"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries),
+                'maxsize': self.maxsize
+            }
+
+class ConnectionManager:
+    """Thread-aware owner of the SQLite connections for one database file.
+
+    A single long-lived writer connection is shared by all threads and
+    serialised with a lock. Every thread that reads gets its own connection,
+    so in WAL mode readers never block (or get blocked by) the writer; the
+    connection is closed after its thread has exited.
+    Nothing touches the disk until the first connection is requested; the
+    optional migrate callable then runs once on the new writer connection.
+    When a QueryCache is attached, each commit invalidates the tables the
+    transaction declared it writes to.
+    """
+
+    def __init__(self, db_path, migrate=None, cache=None):
+        self.db_path = db_path
+        self.migrate = migrate
+        self.cache = cache
+        self._dirty_tables = set()
+        self._dirty_all = False
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self._writer = None
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self._generation = 0
+
+    def _connect(self):
+        """Open a tuned connection in autocommit mode"""
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_SECONDS,
+                               isolation_level=None, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def open(self):
+        """Open the writer connection, migrating the schema on first use"""
+        with self._write_lock:
+            if self._writer is None:
+                conn = self._connect()
+                try:
+                    if self.migrate is not None:
+                        self.migrate(conn)
+                except Exception:
+                    conn.close()
+                    raise
+                self._writer = conn
+            return self._writer
+
+    def _note_writes(self, tables):
+        if tables is None:
+            self._dirty_all = True
+        else:
+            self._dirty_tables.update(tables)
+
+    @contextmanager
+    def write(self, tables=None):
+        """Yield the writer connection inside a single transaction.
+
+        tables names what the transaction modifies, for cache invalidation;
+        None (the default) invalidates every cached result.
+        """
+        with self._write_lock:
+            conn = self.open()
+            
+            # Nested use from the same thread joins the outer transaction
+            if self._write_depth:
+                self._note_writes(tables)
+                self._write_depth += 1
+                try:
+                    yield conn
+                finally:
+                    self._write_depth -= 1
+                return
+            
+            self._dirty_tables = set()
+            self._dirty_all = False
+            self._note_writes(tables)
+            
+            conn.execute("BEGIN IMMEDIATE")
+            self._write_depth = 1
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                # Also covers a failed COMMIT (e.g. SQLITE_FULL), which can
+                # leave the transaction open
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._write_depth = 0
+            
+            if self.cache is not None:
+                self.cache.invalidate(None if self._dirty_all else self._dirty_tables)
+
+    def read(self):
+        """Return the calling thread's read connection"""
+        cached = getattr(self._local, "reader", None)
+        if cached is not None and cached[0] == self._generation:
+            return cached[1]
         
-        # Add points column if it doesn't exist (for existing databases)
+        # The schema must be current before anyone reads from it
+        if self._writer is None:
+            self.open()
+        
+        conn = self._connect()
+        with self._readers_lock:
+            # Close readers left behind by exited threads (short-lived pools)
+            live = []
+            for thread, reader in self._readers:
+                if thread.is_alive():
+                    live.append((thread, reader))
+                else:
+                    reader.close()
+            live.append((threading.current_thread(), conn))
+            self._readers = live
+        self._local.reader = (self._generation, conn)
+        return conn
+
+    def backup_to(self, dest_path, pages_per_step):
+        """Copy a consistent snapshot with the SQLite online backup API.
+
+        Pages are copied pages_per_step at a time from a dedicated source
+        connection, so no step holds the database for long and the UI writer
+        keeps going; in WAL mode the copy includes committed WAL content.
+        """
+        self.open()
+        source = self._connect()
         try:
-            c.execute("ALTER TABLE cpd_entries ADD COLUMN points INTEGER DEFAULT 0")
-        except sqlite3.OperationalError:
-            # Column already exists
-            pass
-        
-        # Create backup tracking table
-        c.execute("""CREATE TABLE IF NOT EXISTS backup_log (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            backup_date TEXT NOT NULL,
-            backup_path TEXT NOT NULL,
-            entries_count INTEGER,
-            status TEXT DEFAULT 'completed'
+            dest = sqlite3.connect(dest_path, isolation_level=None)
+            try:
+                source.backup(dest, pages=pages_per_step)
+                # Make the snapshot a single self-contained file
+                dest.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                dest.close()
+        finally:
+            source.close()
+
+    def replace_with(self, source_path):
+        """Atomically swap source_path in as the database file.
+
+        Runs under the write lock: every connection is closed, stale WAL
+        and shared-memory files are removed so they cannot be replayed onto
+        the new file, and source_path (which must be on the same file
+        system) is renamed over db_path. The next use reopens and migrates.
+        """
+        with self._write_lock:
+            self.close()
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(self.db_path + suffix):
+                    os.remove(self.db_path + suffix)
+            os.replace(source_path, self.db_path)
+
+    def close(self):
+        """Close the writer and every reader connection"""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            with self._readers_lock:
+                for _, conn in self._readers:
+                    try:
+                        conn.close()
+                    except sqlite3.Error:
+                        pass
+                self._readers = []
+                self._generation += 1
+            if self.cache is not None:
+                self.cache.invalidate()
+
+# Schema migrations, applied in order. Each one upgrades the database by a
+# single version; PRAGMA user_version records the version a file is at.
+def _migration_1_base_schema(c):
+    """Base schema: entries, backup log and schema history"""
+    c.execute("""CREATE TABLE IF NOT EXISTS cpd_entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        date_created TEXT NOT NULL,
+        date_start TEXT NOT NULL,
+        date_end TEXT NOT NULL,
+        name TEXT NOT NULL,
+        type TEXT NOT NULL,
+        description TEXT NOT NULL,
+        photo TEXT,
+        points INTEGER DEFAULT 0,
+        created_timestamp REAL DEFAULT (julianday('now'))
+    )""")
+    
+    # Databases created before points existed need the column added
+    columns = [row[1] for row in c.execute("PRAGMA table_info(cpd_entries)")]
+    if "points" not in columns:
+        c.execute("ALTER TABLE cpd_entries ADD COLUMN points INTEGER DEFAULT 0")
+    
+    c.execute("""CREATE TABLE IF NOT EXISTS backup_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        backup_date TEXT NOT NULL,
+        backup_path TEXT NOT NULL,
+        entries_count INTEGER,
+        status TEXT DEFAULT 'completed'
+    )""")
+    
+    c.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at TEXT NOT NULL
+    )""")
+    
+    c.execute("CREATE INDEX IF NOT EXISTS idx_date_start ON cpd_entries(date_start)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_type ON cpd_entries(type)")
+
+def _migration_2_type_date_index(c):
+    """Composite index serving type-filtered, date-ordered pages"""
+    # SQLite appends the rowid (id) to every index, so (type, date_start)
+    # covers the (date_start, id) keyset within a type and supersedes idx_type
+    c.execute("CREATE INDEX IF NOT EXISTS idx_type_date_start ON cpd_entries(type, date_start)")
+    c.execute("DROP INDEX IF EXISTS idx_type")
+
+# Month/type bucket of an entry row (NEW or OLD inside a trigger)
+_SUMMARY_KEY = ("CAST(substr({row}.date_start, 1, 4) AS INTEGER), "
+                "CAST(substr({row}.date_start, 6, 2) AS INTEGER), {row}.type")
+_SUMMARY_ADD = ("""INSERT INTO points_summary (year, month, type, entries, points)
+                   VALUES ({key}, 1, COALESCE(NEW.points, 0))
+                   ON CONFLICT (year, month, type) DO UPDATE
+                   SET entries = entries + 1, points = points + excluded.points;"""
+                .format(key=_SUMMARY_KEY.format(row="NEW")))
+_SUMMARY_REMOVE = ("""UPDATE points_summary
+                      SET entries = entries - 1, points = points - COALESCE(OLD.points, 0)
+                      WHERE (year, month, type) = ({key});
+                      DELETE FROM points_summary
+                      WHERE (year, month, type) = ({key}) AND entries <= 0;"""
+                   .format(key=_SUMMARY_KEY.format(row="OLD")))
+
+def _migration_3_points_summary(c):
+    """Trigger-maintained points totals per (year, month, type)"""
+    c.execute("""CREATE TABLE IF NOT EXISTS points_summary (
+        year INTEGER NOT NULL,
+        month INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        entries INTEGER NOT NULL DEFAULT 0,
+        points INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (year, month, type)
+    ) WITHOUT ROWID""")
+    
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_summary_insert
+                  AFTER INSERT ON cpd_entries BEGIN {_SUMMARY_ADD} END""")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_summary_delete
+                  AFTER DELETE ON cpd_entries BEGIN {_SUMMARY_REMOVE} END""")
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_summary_update
+                  AFTER UPDATE OF date_start, type, points ON cpd_entries
+                  BEGIN {_SUMMARY_REMOVE} {_SUMMARY_ADD} END""")
+    
+    # Backfill from the entries recorded before the summary existed
+    c.execute("DELETE FROM points_summary")
+    c.execute("""INSERT INTO points_summary (year, month, type, entries, points)
+                 SELECT CAST(substr(date_start, 1, 4) AS INTEGER),
+                        CAST(substr(date_start, 6, 2) AS INTEGER),
+                        type, COUNT(*), COALESCE(SUM(points), 0)
+                 FROM cpd_entries GROUP BY 1, 2, 3""")
+
+def _migration_4_full_text_search(c):
+    """OCR text column and an FTS5 index over name/description/OCR text"""
+    columns = [row[1] for row in c.execute("PRAGMA table_info(cpd_entries)")]
+    if "ocr_text" not in columns:
+        c.execute("ALTER TABLE cpd_entries ADD COLUMN ocr_text TEXT")
+    
+    try:
+        c.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+            name, description, ocr_text,
+            content='cpd_entries', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
         )""")
+    except sqlite3.OperationalError as e:
+        # Some SQLite builds ship without FTS5; search() falls back to LIKE
+        Logger.warning(f"CPD: Full-text search unavailable: {e}")
+        return
+    
+    c.execute("""CREATE TRIGGER IF NOT EXISTS trg_fts_insert AFTER INSERT ON cpd_entries BEGIN
+                     INSERT INTO entries_fts (rowid, name, description, ocr_text)
+                     VALUES (NEW.id, NEW.name, NEW.description, NEW.ocr_text);
+                 END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS trg_fts_delete AFTER DELETE ON cpd_entries BEGIN
+                     INSERT INTO entries_fts (entries_fts, rowid, name, description, ocr_text)
+                     VALUES ('delete', OLD.id, OLD.name, OLD.description, OLD.ocr_text);
+                 END""")
+    c.execute("""CREATE TRIGGER IF NOT EXISTS trg_fts_update
+                 AFTER UPDATE OF name, description, ocr_text ON cpd_entries BEGIN
+                     INSERT INTO entries_fts (entries_fts, rowid, name, description, ocr_text)
+                     VALUES ('delete', OLD.id, OLD.name, OLD.description, OLD.ocr_text);
+                     INSERT INTO entries_fts (rowid, name, description, ocr_text)
+                     VALUES (NEW.id, NEW.name, NEW.description, NEW.ocr_text);
+                 END""")
+    c.execute("INSERT INTO entries_fts (entries_fts) VALUES ('rebuild')")
+
+# Day numbers count days since 1970-01-01; julianday() of that date is 2440587.5
+_SQL_DAY_NUMBER = "CAST(julianday({column}) - 2440587.5 AS INTEGER)"
+# TEXT timestamps are local time; the 'utc' modifier converts them to epoch
+_SQL_EPOCH = "CAST(strftime('%s', {column}, 'utc') AS INTEGER)"
+
+def _migration_5_integer_dates(c):
+    """Integer shadow columns for dates, backfilled and indexed"""
+    c.execute("ALTER TABLE cpd_entries ADD COLUMN start_day INTEGER")
+    c.execute("ALTER TABLE cpd_entries ADD COLUMN end_day INTEGER")
+    c.execute("ALTER TABLE cpd_entries ADD COLUMN created_ts INTEGER")
+    c.execute("ALTER TABLE backup_log ADD COLUMN backup_ts INTEGER")
+    
+    c.execute(f"""UPDATE cpd_entries SET
+                  start_day = {_SQL_DAY_NUMBER.format(column="date_start")},
+                  end_day = {_SQL_DAY_NUMBER.format(column="date_end")},
+                  created_ts = {_SQL_EPOCH.format(column="date_created")}""")
+    c.execute(f"UPDATE backup_log SET backup_ts = {_SQL_EPOCH.format(column='backup_date')}")
+    
+    # Inserts fill the columns from Python; keep them right if dates are edited
+    c.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_entry_days_update
+                  AFTER UPDATE OF date_start, date_end ON cpd_entries BEGIN
+                      UPDATE cpd_entries SET
+                          start_day = {_SQL_DAY_NUMBER.format(column="NEW.date_start")},
+                          end_day = {_SQL_DAY_NUMBER.format(column="NEW.date_end")}
+                      WHERE id = NEW.id;
+                  END""")
+    
+    # Listing and range filters now sort on start_day instead of the TEXT date
+    c.execute("DROP INDEX IF EXISTS idx_date_start")
+    c.execute("DROP INDEX IF EXISTS idx_type_date_start")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_start_day ON cpd_entries(start_day)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_type_start_day ON cpd_entries(type, start_day)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_backup_status_ts ON backup_log(status, backup_ts)")
+
+def _migration_6_photo_manifest(c):
+    """Photo manifest for incremental backups, backup kind in the log"""
+    c.execute("""CREATE TABLE IF NOT EXISTS photo_manifest (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        sha256 TEXT NOT NULL,
+        archive TEXT NOT NULL
+    ) WITHOUT ROWID""")
+    c.execute("ALTER TABLE backup_log ADD COLUMN kind TEXT DEFAULT 'full'")
+
+def _migration_7_backup_verification(c):
+    """Outcome and duration of the integrity check run on each backup"""
+    c.execute("ALTER TABLE backup_log ADD COLUMN verify_status TEXT")
+    c.execute("ALTER TABLE backup_log ADD COLUMN verify_seconds REAL")
+    c.execute("ALTER TABLE backup_log ADD COLUMN verified_ts INTEGER")
+
+def _migration_8_app_metadata(c):
+    """Key/value metadata, seeded with the last completed backup time"""
+    c.execute("""CREATE TABLE IF NOT EXISTS app_metadata (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    ) WITHOUT ROWID""")
+    c.execute("""INSERT OR REPLACE INTO app_metadata (key, value)
+                 SELECT 'last_backup_ts', MAX(backup_ts) FROM backup_log
+                 WHERE status = 'completed' HAVING MAX(backup_ts) IS NOT NULL""")
+
+def _migration_9_drive_folders(c):
+    """Drive folder path -> folder ID cache"""
+    c.execute("""CREATE TABLE IF NOT EXISTS drive_folders (
+        path TEXT PRIMARY KEY,
+        folder_id TEXT NOT NULL
+    ) WITHOUT ROWID""")
+
+def _migration_10_upload_outbox(c):
+    """Durable queue of pending Drive uploads, one row per local file"""
+    c.execute("""CREATE TABLE IF NOT EXISTS upload_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        local_path TEXT NOT NULL UNIQUE,
+        remote_path TEXT NOT NULL DEFAULT '',
+        version INTEGER NOT NULL DEFAULT 1,
+        enqueued_ts REAL NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_ts REAL NOT NULL,
+        last_error TEXT
+    )""")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_outbox_next_attempt ON upload_outbox(next_attempt_ts)")
+
+def _migration_11_remote_files(c):
+    """What each local file looked like when it was last uploaded to Drive"""
+    c.execute("""CREATE TABLE IF NOT EXISTS remote_files (
+        path TEXT PRIMARY KEY,
+        remote_path TEXT NOT NULL,
+        size INTEGER,
+        mtime_ns INTEGER,
+        local_md5 TEXT,
+        file_id TEXT NOT NULL,
+        md5_checksum TEXT
+    ) WITHOUT ROWID""")
+
+def _migration_12_upload_sessions(c):
+    """Open resumable upload sessions, so large uploads survive restarts"""
+    c.execute("""CREATE TABLE IF NOT EXISTS upload_sessions (
+        path TEXT PRIMARY KEY,
+        remote_path TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        session_uri TEXT NOT NULL,
+        offset INTEGER NOT NULL,
+        chunk_size INTEGER NOT NULL,
+        updated_ts INTEGER NOT NULL
+    ) WITHOUT ROWID""")
+
+MIGRATIONS = [
+    (1, "base schema", _migration_1_base_schema),
+    (2, "type/date_start keyset index", _migration_2_type_date_index),
+    (3, "points summary table", _migration_3_points_summary),
+    (4, "full-text search", _migration_4_full_text_search),
+    (5, "integer date columns", _migration_5_integer_dates),
+    (6, "photo backup manifest", _migration_6_photo_manifest),
+    (7, "backup verification", _migration_7_backup_verification),
+    (8, "app metadata", _migration_8_app_metadata),
+    (9, "drive folder cache", _migration_9_drive_folders),
+    (10, "upload outbox", _migration_10_upload_outbox),
+    (11, "remote file index", _migration_11_remote_files),
+    (12, "resumable upload sessions", _migration_12_upload_sessions),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def migrate(conn):
+    """Apply any pending migrations to an open connection"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
+    
+    for target, description, migration in MIGRATIONS:
+        if target <= version:
+            continue
         
-        # Create index for better performance
-        c.execute("""CREATE INDEX IF NOT EXISTS idx_date_start 
-                     ON cpd_entries(date_start)""")
-        c.execute("""CREATE INDEX IF NOT EXISTS idx_type 
-                     ON cpd_entries(type)""")
-        
-        conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another connection may have migrated while we waited for the lock
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= target:
+                conn.execute("COMMIT")
+                continue
+            
+            migration(conn)
+            conn.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                         (target, description, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            conn.execute(f"PRAGMA user_version = {target}")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        Logger.info(f"CPD: Database migrated to version {target} ({description})")
+
+_cache = QueryCache()
+_manager = ConnectionManager(DB_PATH, migrate, _cache)
+
+def get_connection_manager():
+    """Return the process-wide connection manager"""
+    return _manager
+
+def get_cache_stats():
+    """Return read-cache hit/miss counters"""
+    return _cache.stats()
+
+def clear_cache():
+    """Drop every cached query result"""
+    _cache.invalidate()
+
+def close_connections():
+    """Close all open connections (app shutdown, restore, tests)"""
+    _manager.close()
+
+def set_database_path(db_path):
+    """Point the connection manager at a different database file"""
+    global DB_PATH
+    _manager.close()
+    DB_PATH = db_path
+    _manager.db_path = db_path
+
+def ensure_directory():
+    """Ensure the database directory exists"""
+    os.makedirs(DB_DIR, exist_ok=True)
+
+def init_db():
+    """Open the database, applying pending schema migrations"""
+    try:
+        _manager.open()
         Logger.info("CPD: Database initialized successfully")
-        
     except Exception as e:
         Logger.error(f"CPD: Database initialization error: {e}")
         raise
-    finally:
-        conn.close()
+
+INSERT_ENTRY_SQL = """INSERT INTO cpd_entries 
+             (date_created, date_start, date_end, name, type, description, photo, points, ocr_text,
+              start_day, end_day, created_ts) 
+             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+EPOCH_DATE = date(1970, 1, 1)
+
+def day_number(value):
+    """Days since 1970-01-01 for a 'YYYY-MM-DD' string or date"""
+    if isinstance(value, str):
+        value = datetime.strptime(value, "%Y-%m-%d").date()
+    elif isinstance(value, datetime):
+        value = value.date()
+    return (value - EPOCH_DATE).days
+
+def day_to_date(day):
+    """Inverse of day_number, as a 'YYYY-MM-DD' string"""
+    return date.fromordinal(EPOCH_DATE.toordinal() + day).strftime("%Y-%m-%d")
+
+def epoch_seconds(timestamp):
+    """Epoch seconds for a local 'YYYY-MM-DD HH:MM:SS' string"""
+    return int(datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").timestamp())
 
 def insert_entry(data):
     """Insert a new CPD entry"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        c.execute("""INSERT INTO cpd_entries 
-                     (date_created, date_start, date_end, name, type, description, photo, points) 
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                  (data["date"], data["date_start"], data["date_end"], 
-                   data["name"], data["type"], data["description"], data["photo"], data["points"]))
-        
-        entry_id = c.lastrowid
-        conn.commit()
+        with _manager.write(("cpd_entries",)) as conn:
+            c = conn.execute(INSERT_ENTRY_SQL,
+                      (data["date"], data["date_start"], data["date_end"], 
+                       data["name"], data["type"], data["description"], data["photo"], data["points"],
+                       data.get("ocr_text"), day_number(data["date_start"]), day_number(data["date_end"]),
+                       epoch_seconds(data["date"])))
+            entry_id = c.lastrowid
         
         Logger.info(f"CPD: Entry {entry_id} inserted successfully")
         return entry_id
@@ -85,80 +623,549 @@ def insert_entry(data):
     except Exception as e:
         Logger.error(f"CPD: Error inserting entry: {e}")
         raise
-    finally:
-        conn.close()
+
+def validate_entry(data):
+    """Validate an entry dict and return its INSERT parameters.
+
+    date, photo, points and ocr_text are optional (defaulting to now, "",
+    0 and NULL) so rows imported from a spreadsheet only need the
+    user-visible fields.
+    Raises ValueError describing the first problem found.
+    """
+    for field in ("date_start", "date_end", "name", "type", "description"):
+        value = data.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f"'{field}' is required")
+    
+    try:
+        start = datetime.strptime(data["date_start"], "%Y-%m-%d")
+        end = datetime.strptime(data["date_end"], "%Y-%m-%d")
+    except ValueError:
+        raise ValueError("Dates must use the YYYY-MM-DD format")
+    if end < start:
+        raise ValueError("End date cannot be before start date")
+    
+    points = data.get("points") or 0
+    if isinstance(points, bool) or not isinstance(points, int) or points < 0:
+        raise ValueError("'points' must be a non-negative integer")
+    
+    created = data.get("date") or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        created_ts = epoch_seconds(created)
+    except ValueError:
+        raise ValueError("'date' must use the YYYY-MM-DD HH:MM:SS format")
+    
+    return (created, data["date_start"], data["date_end"], data["name"],
+            data["type"], data["description"], data.get("photo") or "", points,
+            data.get("ocr_text"), day_number(start), day_number(end), created_ts)
+
+def insert_entries(entries, batch_size=DEFAULT_BATCH_SIZE):
+    """Insert many CPD entries in a single transaction.
+
+    entries may be any iterable of entry dicts; it is consumed batch_size
+    rows at a time so large imports never sit in memory as a whole. Every
+    row is validated first and any error rolls back the entire import.
+    Returns the ids assigned to the new entries, in input order.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    
+    ids = []
+    try:
+        with _manager.write(("cpd_entries",)) as conn:
+            batch = []
+            for index, data in enumerate(entries):
+                try:
+                    batch.append(validate_entry(data))
+                except ValueError as e:
+                    raise ValueError(f"Entry {index}: {e}") from None
+                if len(batch) == batch_size:
+                    ids.extend(_insert_batch(conn, batch))
+                    batch = []
+            if batch:
+                ids.extend(_insert_batch(conn, batch))
+        
+        Logger.info(f"CPD: {len(ids)} entries inserted successfully")
+        return ids
+        
+    except Exception as e:
+        Logger.error(f"CPD: Error inserting entries: {e}")
+        raise
+
+def _insert_batch(conn, batch):
+    """executemany one batch and return the ids it was assigned"""
+    conn.executemany(INSERT_ENTRY_SQL, batch)
+    # AUTOINCREMENT ids are handed out consecutively while we hold the writer
+    last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    return range(last_id - len(batch) + 1, last_id + 1)
+
+# Columns callers may request from the streaming reader
+ENTRY_COLUMNS = ("id", "date_created", "date_start", "date_end", "name",
+                 "type", "description", "photo", "points", "ocr_text",
+                 "start_day", "end_day", "created_ts")
+DEFAULT_PAGE_SIZE = 200
+
+def get_entries_page(page_size=DEFAULT_PAGE_SIZE, after=None, entry_type=None,
+                     start_date=None, end_date=None, columns=ENTRY_COLUMNS[:8], cached=True):
+    """Fetch one page of entries, newest date_start first.
+
+    start_date and end_date bound date_start inclusively ('YYYY-MM-DD' or
+    date). after is the (start_day, id) cursor returned with the previous
+    page; filtering and ordering run on the integer start_day column.
+    Only first pages go through the read cache, and none do with
+    cached=False. Returns (rows, cursor); cursor is None once the last
+    page is reached.
+    """
+    if page_size < 1:
+        raise ValueError("page_size must be at least 1")
+    unknown = set(columns) - set(ENTRY_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown entry columns: {', '.join(sorted(unknown))}")
+    
+    start_day = day_number(start_date) if start_date is not None else None
+    end_day = day_number(end_date) if end_date is not None else None
+    after = tuple(after) if after is not None else None
+    
+    load = lambda: _load_entries_page(page_size, after, entry_type, start_day, end_day, columns)
+    if not cached or after is not None:
+        # Deeper keyset pages are rarely re-read and would flush the hot entries
+        rows, cursor = load()
+    else:
+        key = ("entries_page", page_size, entry_type, start_day, end_day, tuple(columns))
+        rows, cursor = _cache.get_or_load(key, ("cpd_entries",), load)
+    return list(rows), cursor
+
+def _load_entries_page(page_size, after, entry_type, start_day, end_day, columns):
+    """Run the keyset page query; returns (rows tuple, cursor)"""
+    clauses = []
+    params = []
+    if entry_type is not None:
+        clauses.append("type = ?")
+        params.append(entry_type)
+    if start_day is not None:
+        clauses.append("start_day >= ?")
+        params.append(start_day)
+    if end_day is not None:
+        clauses.append("start_day <= ?")
+        params.append(end_day)
+    if after is not None:
+        clauses.append("(start_day, id) < (?, ?)")
+        params.extend(after)
+    
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    c = _manager.read().execute(f"""SELECT start_day, id, {', '.join(columns)}
+                 FROM cpd_entries {where}
+                 ORDER BY start_day DESC, id DESC LIMIT ?""",
+              params + [page_size])
+    page = c.fetchall()
+    
+    rows = tuple(row[2:] for row in page)
+    cursor = (page[-1][0], page[-1][1]) if len(page) == page_size else None
+    return rows, cursor
+
+def iter_entries(page_size=DEFAULT_PAGE_SIZE, after=None, entry_type=None,
+                 start_date=None, end_date=None, columns=ENTRY_COLUMNS[:8]):
+    """Yield entries lazily, one keyset page at a time, bypassing the read cache"""
+    cursor = after
+    while True:
+        rows, cursor = get_entries_page(page_size, cursor, entry_type,
+                                        start_date, end_date, columns, cached=False)
+        yield from rows
+        if cursor is None:
+            return
 
 def get_all_entries():
     """Retrieve all CPD entries"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
+        return list(iter_entries())
         
-        c.execute("""SELECT id, date_created, date_start, date_end, name, type, description, photo 
-                     FROM cpd_entries ORDER BY date_start DESC""")
+    except Exception as e:
+        Logger.error(f"CPD: Error retrieving entries: {e}")
+        return []
+
+# Groupings understood by get_points_summary: (key columns, ORDER BY)
+SUMMARY_GROUPS = {
+    "type": ("type", "type"),
+    "year": ("year", "year"),
+    "month": ("year, month", "year, month"),
+    "month_type": ("year, month, type", "year, month, type"),
+    None: ("", ""),
+}
+
+def _month_key(value):
+    """Turn 'YYYY-MM' or 'YYYY-MM-DD' into a (year, month) tuple"""
+    year, month = value.split("-")[:2]
+    return int(year), int(month)
+
+def get_points_summary(start=None, end=None, group_by="type"):
+    """Total entries and points from the points_summary table.
+
+    start and end ('YYYY-MM' or 'YYYY-MM-DD') select whole months by
+    date_start, inclusive. group_by is one of SUMMARY_GROUPS; each row is
+    the group key columns followed by (entries, points). Only the summary
+    table is read, so the cost does not grow with the number of entries.
+    """
+    if group_by not in SUMMARY_GROUPS:
+        raise ValueError(f"Unknown summary grouping: {group_by}")
+    key_columns, order_by = SUMMARY_GROUPS[group_by]
+    
+    start_key = _month_key(start) if start is not None else None
+    end_key = _month_key(end) if end is not None else None
+    
+    clauses = []
+    params = []
+    if start_key is not None:
+        clauses.append("(year, month) >= (?, ?)")
+        params.extend(start_key)
+    if end_key is not None:
+        clauses.append("(year, month) <= (?, ?)")
+        params.extend(end_key)
+    
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    select = f"{key_columns}, " if key_columns else ""
+    group = f"GROUP BY {key_columns} ORDER BY {order_by}" if key_columns else ""
+    
+    def load():
+        c = _manager.read().execute(f"""SELECT {select}COALESCE(SUM(entries), 0), COALESCE(SUM(points), 0)
+                     FROM points_summary {where} {group}""", params)
+        return tuple(c.fetchall())
+    
+    try:
+        key = ("points_summary", start_key, end_key, group_by)
+        return list(_cache.get_or_load(key, ("cpd_entries",), load))
         
-        entries = c.fetchall()
-        return entries
+    except Exception as e:
+        Logger.error(f"CPD: Error reading points summary: {e}")
+        return []
+
+DEFAULT_SEARCH_LIMIT = 20
+
+def _fts_query(query):
+    """Quote each word of free text as an FTS5 prefix term"""
+    terms = re.findall(r"\w+", query)
+    return " ".join(f'"{term}"*' for term in terms)
+
+def search(query, limit=DEFAULT_SEARCH_LIMIT):
+    """Full-text search over entry names, descriptions and OCR text.
+
+    Returns up to limit (entry_id, snippet) tuples, best match first, with
+    matched words wrapped in [brackets] in the snippet.
+    """
+    match = _fts_query(query)
+    if not match:
+        return []
+    
+    try:
+        key = ("search", query.strip(), limit)
+        return list(_cache.get_or_load(key, ("cpd_entries",), lambda: _load_search(query, match, limit)))
         
     except Exception as e:
-        Logger.error(f"CPD: Error retrieving entries: {e}")
+        Logger.error(f"CPD: Error searching entries: {e}")
         return []
-    finally:
-        conn.close()
+
+def _load_search(query, match, limit):
+    """Run the FTS5 (or LIKE fallback) search query"""
+    conn = _manager.read()
+    has_fts = conn.execute("""SELECT 1 FROM sqlite_master
+                              WHERE type = 'table' AND name = 'entries_fts'""").fetchone()
+    if has_fts:
+        # Weight hits in the activity name above description/OCR hits
+        c = conn.execute("""SELECT rowid, snippet(entries_fts, -1, '[', ']', '...', 12)
+                     FROM entries_fts WHERE entries_fts MATCH ?
+                     ORDER BY bm25(entries_fts, 5.0, 1.0, 1.0) LIMIT ?""",
+                  (match, limit))
+    else:
+        like = f"%{query.strip()}%"
+        c = conn.execute("""SELECT id, substr(description, 1, 80) FROM cpd_entries
+                     WHERE name LIKE ? OR description LIKE ? OR ocr_text LIKE ?
+                     ORDER BY start_day DESC LIMIT ?""",
+                  (like, like, like, limit))
+    return tuple(c.fetchall())
 
 def get_entries_count():
     """Get total number of entries"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        c.execute("SELECT COUNT(*) FROM cpd_entries")
-        count = c.fetchone()[0]
-        return count
+        return _cache.get_or_load(("entries_count",), ("cpd_entries",), lambda:
+            _manager.read().execute("SELECT COUNT(*) FROM cpd_entries").fetchone()[0])
         
     except Exception as e:
         Logger.error(f"CPD: Error getting entries count: {e}")
         return 0
-    finally:
-        conn.close()
 
-def log_backup(backup_path, entries_count, status="completed"):
+def log_backup(backup_path, entries_count, status="completed", kind="full"):
     """Log backup information"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        
-        c.execute("""INSERT INTO backup_log (backup_date, backup_path, entries_count, status) 
-                     VALUES (?, ?, ?, ?)""",
-                  (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 
-                   backup_path, entries_count, status))
+        now = datetime.now()
+        with _manager.write(("backup_log", "app_metadata")) as conn:
+            conn.execute("""INSERT INTO backup_log (backup_date, backup_path, entries_count, status, backup_ts, kind) 
+                         VALUES (?, ?, ?, ?, ?, ?)""",
+                      (now.strftime("%Y-%m-%d %H:%M:%S"), 
+                       backup_path, entries_count, status, int(now.timestamp()), kind))
+            if status == "completed":
+                set_metadata("last_backup_ts", int(now.timestamp()))
         
-        conn.commit()
         Logger.info(f"CPD: Backup logged: {backup_path}")
         
     except Exception as e:
         Logger.error(f"CPD: Error logging backup: {e}")
-    finally:
-        conn.close()
 
-def get_last_backup_date():
-    """Get the date of the last successful backup"""
+def record_verification(backup_path, verify_status, seconds):
+    """Store a verify_backup() outcome on the newest log row for backup_path"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
+        with _manager.write(("backup_log",)) as conn:
+            c = conn.execute("""UPDATE backup_log SET verify_status = ?, verify_seconds = ?, verified_ts = ?
+                         WHERE id = (SELECT MAX(id) FROM backup_log WHERE backup_path = ?)""",
+                      (verify_status, seconds, int(datetime.now().timestamp()), backup_path))
+        return c.rowcount > 0
         
-        c.execute("""SELECT backup_date FROM backup_log 
-                     WHERE status = 'completed' 
-                     ORDER BY backup_date DESC LIMIT 1""")
+    except Exception as e:
+        Logger.error(f"CPD: Error recording backup verification: {e}")
+        return False
+
+def delete_backup_log(backup_paths):
+    """Delete the backup_log rows of removed archives; returns rows deleted"""
+    backup_paths = list(backup_paths)
+    if not backup_paths:
+        return 0
+    try:
+        with _manager.write(("backup_log",)) as conn:
+            c = conn.executemany("DELETE FROM backup_log WHERE backup_path = ?",
+                                 [(path,) for path in backup_paths])
+        return c.rowcount
         
-        result = c.fetchone()
-        return result[0] if result else None
+    except Exception as e:
+        Logger.error(f"CPD: Error deleting backup log rows: {e}")
+        return 0
+
+def get_backup_log_paths():
+    """Distinct archive paths that have backup_log rows"""
+    c = _manager.read().execute("SELECT DISTINCT backup_path FROM backup_log")
+    return [row[0] for row in c.fetchall()]
+
+def get_backup_log(backup_path):
+    """Return the newest backup_log row for backup_path as a dict, or None"""
+    c = _manager.read().execute("""SELECT backup_date, entries_count, status, kind,
+                 verify_status, verify_seconds, verified_ts
+                 FROM backup_log WHERE backup_path = ? ORDER BY id DESC LIMIT 1""", (backup_path,))
+    row = c.fetchone()
+    if row is None:
+        return None
+    return dict(zip(("backup_date", "entries_count", "status", "kind",
+                     "verify_status", "verify_seconds", "verified_ts"), row))
+
+# Online snapshot tuning - pages copied per step of the SQLite backup API
+SNAPSHOT_PAGES_PER_STEP = 256
+
+def snapshot_database(dest_path, pages_per_step=SNAPSHOT_PAGES_PER_STEP):
+    """Write a consistent copy of the database to dest_path.
+
+    Returns the number of entries in the snapshot, counted on the copy so
+    it matches the snapshot exactly even if entries are added meanwhile.
+    """
+    try:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        _manager.backup_to(dest_path, pages_per_step)
+        
+        conn = sqlite3.connect(dest_path)
+        try:
+            entries_count = conn.execute("SELECT COUNT(*) FROM cpd_entries").fetchone()[0]
+        finally:
+            conn.close()
+        
+        Logger.info(f"CPD: Database snapshot written: {dest_path} ({entries_count} entries)")
+        return entries_count
+        
+    except Exception as e:
+        Logger.error(f"CPD: Error creating database snapshot: {e}")
+        raise
+
+def restore_database_file(source_path):
+    """Replace the live database with the file at source_path, then reopen it.
+
+    Returns the number of entries in the restored database.
+    """
+    try:
+        _manager.replace_with(source_path)
+        _manager.open()
+        entries_count = _manager.read().execute("SELECT COUNT(*) FROM cpd_entries").fetchone()[0]
+        
+        Logger.info(f"CPD: Database restored ({entries_count} entries)")
+        return entries_count
+        
+    except Exception as e:
+        Logger.error(f"CPD: Error restoring database: {e}")
+        raise
+
+def get_entry_photo(entry_id):
+    """Return the photo path stored for an entry ("" if none, None if no entry)"""
+    row = _manager.read().execute("SELECT photo FROM cpd_entries WHERE id = ?", (entry_id,)).fetchone()
+    return None if row is None else (row[0] or "")
+
+def get_photo_manifest():
+    """Return {path: (size, mtime_ns, sha256, archive)} for backed-up photos"""
+    c = _manager.read().execute("SELECT path, size, mtime_ns, sha256, archive FROM photo_manifest")
+    return {row[0]: row[1:] for row in c}
+
+def replace_photo_manifest(photos):
+    """Replace the photo manifest after a backup archive is finished.
+
+    photos maps path -> (size, mtime_ns, sha256, archive) for every photo
+    the new backup covers; photos no longer present are dropped.
+    """
+    with _manager.write(("photo_manifest",)) as conn:
+        conn.execute("DELETE FROM photo_manifest")
+        conn.executemany("""INSERT INTO photo_manifest (path, size, mtime_ns, sha256, archive)
+                            VALUES (?, ?, ?, ?, ?)""",
+                         ((path,) + tuple(row) for path, row in photos.items()))
+
+def get_referenced_archives():
+    """Names of the backup archives the current photo set depends on"""
+    c = _manager.read().execute("SELECT DISTINCT archive FROM photo_manifest")
+    return {row[0] for row in c}
+
+def get_metadata(key, default=None):
+    """Read one app_metadata value (cached until app_metadata is written)"""
+    value = _cache.get_or_load(("metadata", key), ("app_metadata",), lambda: _load_metadata(key))
+    return default if value is None else value
+
+def _load_metadata(key):
+    row = _manager.read().execute("SELECT value FROM app_metadata WHERE key = ?", (key,)).fetchone()
+    return None if row is None else row[0]
+
+def set_metadata(key, value):
+    """Store one app_metadata value (joins the caller's transaction if any)"""
+    with _manager.write(("app_metadata",)) as conn:
+        conn.execute("INSERT OR REPLACE INTO app_metadata (key, value) VALUES (?, ?)", (key, value))
+
+def get_last_backup_timestamp():
+    """Get the epoch time of the last successful backup.
+
+    log_backup keeps it in app_metadata and the read cache holds it until
+    the next backup, so the hot path never scans backup_log.
+    """
+    try:
+        value = get_metadata("last_backup_ts")
+        return None if value is None else int(value)
         
     except Exception as e:
-        Logger.error(f"CPD: Error getting last backup date: {e}")
+        Logger.error(f"CPD: Error getting last backup time: {e}")
+        return None
+
+def get_last_backup_date():
+    """Get the date of the last successful backup"""
+    timestamp = get_last_backup_timestamp()
+    if timestamp is None:
         return None
-    finally:
-        conn.close()
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+def get_drive_folder_id(path):
+    """Cached Drive folder ID for a 'A/B/C' folder path, or None"""
+    return _cache.get_or_load(("drive_folder", path), ("drive_folders",), lambda:
+        (_manager.read().execute("SELECT folder_id FROM drive_folders WHERE path = ?", (path,)).fetchone()
+         or (None,))[0])
+
+def set_drive_folder_id(path, folder_id):
+    """Remember the Drive folder ID of a folder path"""
+    with _manager.write(("drive_folders",)) as conn:
+        conn.execute("INSERT OR REPLACE INTO drive_folders (path, folder_id) VALUES (?, ?)", (path, folder_id))
+
+def forget_drive_folder(path):
+    """Drop a folder path and everything below it from the Drive folder cache"""
+    with _manager.write(("drive_folders",)) as conn:
+        conn.execute("DELETE FROM drive_folders WHERE path = ? OR substr(path, 1, ?) = ?",
+                     (path, len(path) + 1, path + "/"))
+
+def enqueue_upload(local_path, remote_path=None, now=None):
+    """Add a file to the upload outbox, or refresh its pending row.
+
+    Re-queuing a file that is already waiting bumps its version and makes
+    it due at once, so it is uploaded once in its latest state; the row
+    keeps its original enqueued_ts for age monitoring.
+    """
+    now = time.time() if now is None else now
+    with _manager.write(("upload_outbox",)) as conn:
+        conn.execute("""INSERT INTO upload_outbox (local_path, remote_path, enqueued_ts, next_attempt_ts)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT (local_path) DO UPDATE SET
+                            remote_path = excluded.remote_path, version = version + 1,
+                            attempts = 0, next_attempt_ts = excluded.next_attempt_ts, last_error = NULL""",
+                     (local_path, remote_path or "", now, now))
+
+def get_due_uploads(now=None, limit=20):
+    """Outbox rows due for an attempt: (id, local_path, remote_path, version, attempts)"""
+    now = time.time() if now is None else now
+    c = _manager.read().execute("""SELECT id, local_path, remote_path, version, attempts
+                 FROM upload_outbox WHERE next_attempt_ts <= ?
+                 ORDER BY next_attempt_ts LIMIT ?""", (now, limit))
+    return c.fetchall()
+
+def complete_upload(upload_id, version):
+    """Remove an uploaded row unless it was re-queued while uploading"""
+    with _manager.write(("upload_outbox",)) as conn:
+        c = conn.execute("DELETE FROM upload_outbox WHERE id = ? AND version = ?", (upload_id, version))
+    return c.rowcount > 0
+
+def fail_upload(upload_id, version, next_attempt_ts, error):
+    """Record a failed attempt and when to try again"""
+    with _manager.write(("upload_outbox",)) as conn:
+        conn.execute("""UPDATE upload_outbox SET attempts = attempts + 1, next_attempt_ts = ?, last_error = ?
+                        WHERE id = ? AND version = ?""", (next_attempt_ts, error, upload_id, version))
+
+def get_outbox_stats(now=None):
+    """Queue depth and age of the upload outbox.
+
+    Returns depth, failing (rows with failed attempts), oldest_age_seconds
+    and next_attempt_in (seconds, 0 if something is due now).
+    """
+    depth, oldest, failing, next_attempt = _cache.get_or_load(("outbox_stats",), ("upload_outbox",), lambda:
+        _manager.read().execute("""SELECT COUNT(*), MIN(enqueued_ts), COALESCE(SUM(attempts > 0), 0),
+                     MIN(next_attempt_ts) FROM upload_outbox""").fetchone())
+    now = time.time() if now is None else now
+    return {
+        "depth": depth,
+        "failing": failing,
+        "oldest_age_seconds": 0 if oldest is None else max(0, now - oldest),
+        "next_attempt_in": None if next_attempt is None else max(0, next_attempt - now),
+    }
+
+REMOTE_FILE_COLUMNS = "remote_path, size, mtime_ns, local_md5, file_id, md5_checksum"
+
+def get_remote_file(path):
+    """(remote_path, size, mtime_ns, local_md5, file_id, md5_checksum) of an uploaded file, or None"""
+    return _manager.read().execute(f"SELECT {REMOTE_FILE_COLUMNS} FROM remote_files WHERE path = ?",
+                                   (path,)).fetchone()
+
+def get_remote_files():
+    """Every remote_files row as {path: (remote_path, size, mtime_ns, local_md5, file_id, md5_checksum)}"""
+    c = _manager.read().execute(f"SELECT path, {REMOTE_FILE_COLUMNS} FROM remote_files")
+    return {row[0]: row[1:] for row in c}
+
+def record_remote_file(path, remote_path, size, mtime_ns, local_md5, file_id, md5_checksum):
+    """Remember the Drive copy of a local file"""
+    with _manager.write(("remote_files",)) as conn:
+        conn.execute(f"INSERT OR REPLACE INTO remote_files (path, {REMOTE_FILE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     (path, remote_path, size, mtime_ns, local_md5, file_id, md5_checksum))
+
+def forget_remote_file(path):
+    """Drop the Drive record of a local file (its remote copy is gone)"""
+    with _manager.write(("remote_files",)) as conn:
+        conn.execute("DELETE FROM remote_files WHERE path = ?", (path,))
+
+def get_upload_session(path):
+    """(remote_path, size, mtime_ns, session_uri, offset, chunk_size) of an open upload, or None"""
+    return _manager.read().execute("""SELECT remote_path, size, mtime_ns, session_uri, offset, chunk_size
+                                      FROM upload_sessions WHERE path = ?""", (path,)).fetchone()
+
+def save_upload_session(path, remote_path, size, mtime_ns, session_uri, offset, chunk_size):
+    """Persist a resumable session and the byte offset the server confirmed"""
+    with _manager.write(("upload_sessions",)) as conn:
+        conn.execute("""INSERT OR REPLACE INTO upload_sessions
+                        (path, remote_path, size, mtime_ns, session_uri, offset, chunk_size, updated_ts)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                     (path, remote_path, size, mtime_ns, session_uri, offset, chunk_size, int(time.time())))
 
-# Initialize database when module is imported
-init_db()
+def delete_upload_session(path):
+    """Forget a finished or abandoned resumable session"""
+    with _manager.write(("upload_sessions",)) as conn:
+        conn.execute("DELETE FROM upload_sessions WHERE path = ?", (path,))
@@ -1,42 +1,160 @@
 import os
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+import json
+import hashlib
+import mimetypes
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload, build_http
+from google.auth.transport.requests import Request
 from google.oauth2.service_account import Credentials
 from google.auth.exceptions import GoogleAuthError
 from kivy.logger import Logger
+from database import (get_drive_folder_id, set_drive_folder_id, forget_drive_folder,
+                      get_remote_file, get_remote_files, record_remote_file, forget_remote_file,
+                      get_upload_session, save_upload_session, delete_upload_session,
+                      get_metadata, set_metadata)
 
 # Google Drive configuration
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
 SERVICE_ACCOUNT_FILE = 'credentials.json'
 FOLDER_NAME = 'CPD Points'
+FOLDER_MIME_TYPE = 'application/vnd.google-apps.folder'
+RESUMABLE_THRESHOLD = 5 * 1024 * 1024  # Smaller files go up in a single request
+UPLOAD_WORKERS = 4  # Concurrent uploads in upload_many()
+LIST_PAGE_SIZE = 1000  # files().list page size used by reconcile_folder()
+HASH_CHUNK_SIZE = 1024 * 1024
+DRIVE_ENDPOINT = os.environ.get('CPD_DRIVE_ENDPOINT')  # e.g. a fake_drive.py server; no credentials needed
+
+# Resumable upload chunking - sizes must be multiples of CHUNK_ALIGNMENT
+CHUNK_ALIGNMENT = 256 * 1024
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # First chunk size before any throughput is measured
+MIN_CHUNK_SIZE = CHUNK_ALIGNMENT
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+CHUNK_TARGET_SECONDS = 5  # Chunks are sized to take about this long at the measured rate
+
+# Process-wide client, built once and reused by every upload
+_service = None
+_credentials = None
+_service_lock = threading.Lock()
+_local = threading.local()
 
 def check_credentials():
     """Check if Google Drive credentials exist"""
     return os.path.exists(SERVICE_ACCOUNT_FILE)
 
 def get_drive_service():
-    """Initialize and return Google Drive service"""
-    try:
-        if not check_credentials():
-            raise FileNotFoundError(f"Google Drive credentials file '{SERVICE_ACCOUNT_FILE}' not found")
-        
-        creds = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
-        service = build('drive', 'v3', credentials=creds)
-        return service
-        
-    except GoogleAuthError as e:
-        Logger.error(f"CPD: Google authentication error: {e}")
-        raise
-    except Exception as e:
-        Logger.error(f"CPD: Error initializing Google Drive service: {e}")
-        raise
+    """Return the shared Google Drive service, building it on first use.
+
+    credentials.json is read and the client built once per process; an
+    expired access token is refreshed in place before the client is handed
+    out again. With DRIVE_ENDPOINT set the client talks to that server
+    instead, without credentials.
+    """
+    global _service, _credentials
+    with _service_lock:
+        try:
+            if _service is None and DRIVE_ENDPOINT:
+                _service = build_endpoint_service(DRIVE_ENDPOINT)
+            elif _service is None:
+                if not check_credentials():
+                    raise FileNotFoundError(f"Google Drive credentials file '{SERVICE_ACCOUNT_FILE}' not found")
+                
+                _credentials = Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+                _service = build('drive', 'v3', credentials=_credentials, cache_discovery=False)
+            elif _credentials is not None and _credentials.expired:
+                _credentials.refresh(Request())
+            return _service
+            
+        except GoogleAuthError as e:
+            Logger.error(f"CPD: Google authentication error: {e}")
+            raise
+        except Exception as e:
+            Logger.error(f"CPD: Error initializing Google Drive service: {e}")
+            raise
+
+def build_endpoint_service(endpoint):
+    """Build an unauthenticated Drive client whose requests all go to endpoint.
+
+    client_options' api_endpoint only swaps the host of upload URLs and
+    keeps https, so the bundled discovery document is rewritten instead.
+    """
+    endpoint = endpoint.rstrip('/') + '/'
+    document = json.loads(get_static_doc('drive', 'v3'))
+    document['rootUrl'] = endpoint
+    document['baseUrl'] = endpoint + document['servicePath']
+    return build_from_document(document, http=build_http())
 
-def find_or_create_folder(service, folder_name):
-    """Find existing folder or create new one"""
+def set_drive_endpoint(endpoint):
+    """Point uploads at another Drive endpoint (None for the real API)"""
+    global DRIVE_ENDPOINT
+    DRIVE_ENDPOINT = endpoint
+    reset_drive_service()
+
+def _http():
+    """The calling thread's transport for the shared client.
+
+    httplib2 connections are not thread-safe, so each thread gets its own
+    transport around the one shared set of credentials (or a plain one
+    for DRIVE_ENDPOINT). Returns None (use the client's own transport)
+    when the client was built some other way.
+    """
+    credentials = _credentials
+    key = credentials if credentials is not None else DRIVE_ENDPOINT
+    if key is None:
+        return None
+    cached = getattr(_local, "http", None)
+    if cached is None or cached[0] is not key:
+        # build_http() leaves 308 alone; a bare httplib2.Http treats a
+        # resumable upload's 308 reply as a redirect without a Location
+        http = build_http()
+        cached = (key, http if credentials is None else AuthorizedHttp(credentials, http=http))
+        _local.http = cached
+    return cached[1]
+
+class AdaptiveMediaFileUpload(MediaFileUpload):
+    """Resumable MediaFileUpload whose chunk_size may change between chunks"""
+
+    def __init__(self, filename, mimetype, chunk_size):
+        super().__init__(filename, mimetype=mimetype, chunksize=chunk_size, resumable=True)
+        self.chunk_size = chunk_size
+
+    def chunksize(self):
+        return self.chunk_size
+
+def next_chunk_size(chunk_size, sent_bytes, seconds):
+    """Chunk size that should take CHUNK_TARGET_SECONDS at the rate just measured.
+
+    Moves at most a factor of two per chunk so one slow or fast round trip
+    does not swing it, and stays aligned within MIN/MAX_CHUNK_SIZE.
+    """
+    if sent_bytes <= 0 or seconds <= 0:
+        return chunk_size
+    target = sent_bytes / seconds * CHUNK_TARGET_SECONDS
+    target = max(chunk_size / 2, min(chunk_size * 2, target))
+    size = int(target) // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT
+    return max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, size))
+
+def reset_drive_service():
+    """Drop the shared client so the next call rebuilds it"""
+    global _service, _credentials
+    with _service_lock:
+        _service = None
+        _credentials = None
+
+def find_or_create_folder(service, folder_name, parent_id=None):
+    """Find existing folder or create new one (inside parent_id if given)"""
     try:
         # Search for existing folder
-        query = f"name='{folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-        results = service.files().list(q=query, fields="files(id, name)").execute()
+        escaped = folder_name.replace("\\", "\\\\").replace("'", "\\'")
+        query = f"name='{escaped}' and mimeType='{FOLDER_MIME_TYPE}' and trashed=false"
+        if parent_id:
+            query += f" and '{parent_id}' in parents"
+        results = service.files().list(q=query, fields="files(id, name)").execute(http=_http())
         folders = results.get('files', [])
         
         if folders:
@@ -47,9 +165,11 @@ def find_or_create_folder(service, folder_name):
         # Create new folder
         folder_metadata = {
             'name': folder_name,
-            'mimeType': 'application/vnd.google-apps.folder'
+            'mimeType': FOLDER_MIME_TYPE
         }
-        folder = service.files().create(body=folder_metadata, fields='id').execute()
+        if parent_id:
+            folder_metadata['parents'] = [parent_id]
+        folder = service.files().create(body=folder_metadata, fields='id').execute(http=_http())
         folder_id = folder.get('id')
         
         Logger.info(f"CPD: Created new folder '{folder_name}' with ID: {folder_id}")
@@ -59,47 +179,92 @@ def find_or_create_folder(service, folder_name):
         Logger.error(f"CPD: Error with folder operations: {e}")
         raise
 
-def upload_to_drive(zip_path):
-    """Upload backup file to Google Drive"""
+def resolve_folder(service, folder_path):
+    """Drive folder ID for an 'A/B/C' path, creating missing folders.
+
+    IDs are cached in the drive_folders table, so a known path costs no API
+    call; only the segments below the deepest cached ancestor are looked up.
+    """
+    folder_id = get_drive_folder_id(folder_path)
+    if folder_id is not None:
+        return folder_id
+    
+    parts = folder_path.split("/")
+    depth = len(parts) - 1
+    parent_id = None
+    while depth > 0:
+        parent_id = get_drive_folder_id("/".join(parts[:depth]))
+        if parent_id is not None:
+            break
+        depth -= 1
+    
+    for index in range(depth, len(parts)):
+        parent_id = find_or_create_folder(service, parts[index], parent_id)
+        set_drive_folder_id("/".join(parts[:index + 1]), parent_id)
+    return parent_id
+
+def split_remote_path(file_path, remote_path=None):
+    """('CPD Points/sub/folder', 'name') for an optional 'sub/folder/name' path"""
+    if not remote_path:
+        return FOLDER_NAME, os.path.basename(file_path)
+    folder, _, name = remote_path.strip("/").rpartition("/")
+    return (f"{FOLDER_NAME}/{folder}" if folder else FOLDER_NAME), name
+
+def file_md5(file_path):
+    """MD5 hex digest of a file, comparable with Drive's md5Checksum"""
+    digest = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def upload_to_drive(file_path, remote_path=None):
+    """Upload a file to Google Drive.
+
+    remote_path ('CPD_Exports/export.csv') places the file below the CPD
+    Points folder; by default it goes straight into it under its own name.
+    A file whose size and mtime match its remote_files record is skipped
+    without any request, and a changed one replaces its earlier Drive copy.
+    With the client and folder ID cached, a file under RESUMABLE_THRESHOLD
+    is uploaded with exactly one API request. Returns the Drive file ID.
+    """
     try:
-        if not os.path.exists(zip_path):
-            raise FileNotFoundError(f"Backup file not found: {zip_path}")
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Upload file not found: {file_path}")
         
-        # Initialize service
-        service = get_drive_service()
-        
-        # Find or create CPD Points folder
-        folder_id = find_or_create_folder(service, FOLDER_NAME)
-        
-        # Prepare file metadata
-        file_name = os.path.basename(zip_path)
-        file_metadata = {
-            'name': file_name,
-            'parents': [folder_id],
-            'description': f'CPD Tracker backup created on {os.path.getctime(zip_path)}'
-        }
+        local_path = os.path.abspath(file_path)
+        stat = os.stat(local_path)
+        folder_path, file_name = split_remote_path(file_path, remote_path)
+        remote_key = f"{folder_path}/{file_name}"
         
-        # Upload file
-        media = MediaFileUpload(zip_path, mimetype='application/zip', resumable=True)
+        known = get_remote_file(local_path)
+        file_id = known[4] if known is not None and known[0] == remote_key else None
+        if file_id is not None and known[1:3] == (stat.st_size, stat.st_mtime_ns):
+            Logger.info(f"CPD: {file_name} is unchanged on Google Drive, skipping upload")
+            return file_id
         
-        Logger.info(f"CPD: Uploading {file_name} to Google Drive...")
-        
-        request = service.files().create(
-            body=file_metadata,
-            media_body=media,
-            fields='id,name,size'
-        )
-        
-        # Execute upload with progress tracking
-        response = None
-        while response is None:
-            status, response = request.next_chunk()
-            if status:
-                progress = int(status.progress() * 100)
-                Logger.info(f"CPD: Upload progress: {progress}%")
+        service = get_drive_service()
+        try:
+            response = _send_file(service, file_path, file_name, resolve_folder(service, folder_path), file_id,
+                                  (local_path, remote_key, stat))
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            if file_id is not None:
+                # The earlier copy was deleted on Drive: upload a new one
+                Logger.warning(f"CPD: Drive copy of {file_name} is gone, uploading it again")
+                forget_remote_file(local_path)
+            else:
+                # The cached folder was deleted on Drive: forget it and resolve again
+                Logger.warning(f"CPD: Drive folder '{folder_path}' is gone, refreshing folder cache")
+                forget_drive_folder(FOLDER_NAME)
+            response = _send_file(service, file_path, file_name, resolve_folder(service, folder_path),
+                                  None, (local_path, remote_key, stat))
         
         file_id = response.get('id')
         file_size = response.get('size', 'Unknown')
+        record_remote_file(local_path, remote_key, stat.st_size, stat.st_mtime_ns,
+                           file_md5(local_path), file_id, response.get('md5Checksum'))
         
         Logger.info(f"CPD: Upload completed successfully!")
         Logger.info(f"CPD: File ID: {file_id}")
@@ -117,6 +282,241 @@ def upload_to_drive(zip_path):
         Logger.error(f"CPD: Upload error: {e}")
         raise
 
+def _send_file(service, file_path, file_name, folder_id, file_id=None, session=None):
+    """Upload file_path into folder_id, or over file_id, and return the API response.
+
+    session is (local_path, remote_key, stat); large files use it to
+    persist and resume their resumable upload session.
+    """
+    file_metadata = {
+        'name': file_name,
+        'description': f'CPD Tracker file created on {os.path.getctime(file_path)}'
+    }
+    mimetype = mimetypes.guess_type(file_name)[0] or 'application/octet-stream'
+    resumable = os.path.getsize(file_path) > RESUMABLE_THRESHOLD
+    if resumable:
+        media = AdaptiveMediaFileUpload(file_path, mimetype, int(get_metadata("upload_chunk_size", UPLOAD_CHUNK_SIZE)))
+    else:
+        media = MediaFileUpload(file_path, mimetype=mimetype, resumable=False)
+    
+    Logger.info(f"CPD: Uploading {file_name} to Google Drive...")
+    
+    if file_id is not None:
+        request = service.files().update(fileId=file_id, body=file_metadata, media_body=media,
+                                         fields='id,name,size,md5Checksum')
+    else:
+        file_metadata['parents'] = [folder_id]
+        request = service.files().create(body=file_metadata, media_body=media,
+                                         fields='id,name,size,md5Checksum')
+    http = _http()
+    if not resumable:
+        return request.execute(http=http)
+    return _resumable_upload(request, media, http, session)
+
+def _query_offset(http, session_uri, size):
+    """Ask the server how much of a resumable session it has.
+
+    Returns the confirmed byte offset, the finished file's metadata (dict)
+    if the upload had already completed, or None if the session expired
+    (404/410). Any other reply raises HttpError so the saved session is
+    kept for the next attempt.
+    """
+    resp, content = http.request(session_uri, "PUT",
+                                 headers={"Content-Length": "0", "Content-Range": f"bytes */{size}"})
+    if resp.status in (200, 201):
+        return json.loads(content)
+    if resp.status == 308:
+        confirmed = resp.get("range")
+        return int(confirmed.rsplit("-", 1)[1]) + 1 if confirmed else 0
+    if resp.status in (404, 410):
+        return None
+    raise HttpError(resp, content, uri=session_uri)
+
+def _resumable_upload(request, media, http, session):
+    """Drive a resumable upload chunk by chunk, persisting its progress.
+
+    After each chunk the session URI and the offset the server confirmed
+    are saved, so an upload interrupted by the app being killed carries on
+    from there next time. Chunk sizes adapt to the measured throughput and
+    the last size is kept for the next upload.
+    """
+    local_path, remote_key, stat = session if session is not None else (None, None, None)
+    saved = get_upload_session(local_path) if local_path else None
+    if saved is not None:
+        if saved[:3] != (remote_key, stat.st_size, stat.st_mtime_ns):
+            delete_upload_session(local_path)  # the file changed since
+        else:
+            offset = _query_offset(http or request.http, saved[3], stat.st_size)
+            if isinstance(offset, dict):
+                delete_upload_session(local_path)
+                return offset
+            if offset is None:
+                Logger.info(f"CPD: Upload session for {os.path.basename(local_path)} expired, starting over")
+                delete_upload_session(local_path)
+            else:
+                Logger.info(f"CPD: Resuming upload of {os.path.basename(local_path)} at byte {offset}")
+                request.resumable_uri = saved[3]
+                request.resumable_progress = offset
+                media.chunk_size = saved[5]
+    
+    # Execute upload with progress tracking
+    response = None
+    while response is None:
+        sent_before = request.resumable_progress
+        started = time.monotonic()
+        status, response = request.next_chunk(http=http)
+        if response is not None:
+            break
+        
+        if local_path:
+            save_upload_session(local_path, remote_key, stat.st_size, stat.st_mtime_ns,
+                                request.resumable_uri, request.resumable_progress, media.chunk_size)
+        media.chunk_size = next_chunk_size(media.chunk_size, request.resumable_progress - sent_before,
+                                           time.monotonic() - started)
+        if status:
+            progress = int(status.progress() * 100)
+            Logger.info(f"CPD: Upload progress: {progress}%")
+    
+    if local_path:
+        delete_upload_session(local_path)
+    set_metadata("upload_chunk_size", media.chunk_size)
+    return response
+
+def upload_many(items, max_workers=UPLOAD_WORKERS, upload=None):
+    """Upload a batch of files concurrently over one shared Drive client.
+
+    items are local paths or (local_path, remote_path) pairs. The client is
+    authorized and every target folder resolved once up front, then at most
+    max_workers uploads run at a time, each with its own request (and its
+    own resumable session for large files). upload replaces
+    upload_to_drive for callers that wrap it. Returns a report with
+    uploaded {path: file_id}, failed {path: error}, bytes, seconds and
+    mb_per_s.
+    """
+    upload = upload or upload_to_drive
+    items = [(item, None) if isinstance(item, str) else tuple(item) for item in items]
+    report = {"uploaded": {}, "failed": {}, "bytes": 0, "seconds": 0.0, "mb_per_s": 0.0}
+    if not items:
+        return report
+    
+    if upload is upload_to_drive:
+        # Resolve folders serially so concurrent uploads never create duplicates
+        try:
+            service = get_drive_service()
+            for folder_path in sorted({split_remote_path(path, remote)[0] for path, remote in items}):
+                resolve_folder(service, folder_path)
+        except Exception as e:
+            # Each upload retries the lookup and reports its own failure
+            Logger.warning(f"CPD: Could not resolve Drive folders up front: {e}")
+    
+    sizes = {path: os.path.getsize(path) if os.path.exists(path) else 0 for path, _ in items}
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items))),
+                            thread_name_prefix="cpd-upload") as pool:
+        futures = {pool.submit(upload, path, remote): path for path, remote in items}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                report["uploaded"][path] = future.result()
+                report["bytes"] += sizes[path]
+            except Exception as e:
+                report["failed"][path] = str(e)
+    
+    report["seconds"] = time.monotonic() - started
+    if report["seconds"] > 0:
+        report["mb_per_s"] = report["bytes"] / (1024 * 1024) / report["seconds"]
+    Logger.info(f"CPD: Uploaded {len(report['uploaded'])} of {len(items)} files, "
+                f"{report['bytes'] / (1024 * 1024):.1f} MB in {report['seconds']:.1f}s "
+                f"({report['mb_per_s']:.2f} MB/s)")
+    return report
+
+def list_folder_files(service, folder_id):
+    """Every file directly inside a Drive folder, following nextPageToken"""
+    files = []
+    page_token = None
+    while True:
+        results = service.files().list(
+            q=f"'{folder_id}' in parents and trashed=false",
+            fields="nextPageToken, files(id, name, size, md5Checksum)",
+            pageSize=LIST_PAGE_SIZE,
+            pageToken=page_token
+        ).execute(http=_http())
+        files.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return files
+
+def reconcile_folder(local_dir, remote_dir, dry_run=False, max_workers=UPLOAD_WORKERS):
+    """Upload only the files in local_dir that are new or changed on Drive.
+
+    One paginated files().list of the target folder is compared by name and
+    MD5 with the local files; local hashes are reused from remote_files
+    while a file's size and mtime are unchanged. Matching files are adopted
+    into remote_files, changed ones replace their Drive copy. With dry_run
+    nothing is uploaded or recorded. Returns a report of new, changed,
+    unchanged and remote_only names plus the upload_many() results.
+    """
+    service = get_drive_service()
+    folder_path = f"{FOLDER_NAME}/{remote_dir}" if remote_dir else FOLDER_NAME
+    remote = {f['name']: f for f in list_folder_files(service, resolve_folder(service, folder_path))}
+    known_files = get_remote_files()
+    
+    report = {"new": [], "changed": [], "unchanged": [], "remote_only": [], "uploaded": 0, "failed": {}}
+    to_upload = []
+    with os.scandir(local_dir) as entries:
+        local_files = sorted((entry.name, entry.path) for entry in entries if entry.is_file())
+    
+    for name, path in local_files:
+        local_path = os.path.abspath(path)
+        stat = os.stat(local_path)
+        known = known_files.get(local_path)
+        if known is not None and known[1:3] == (stat.st_size, stat.st_mtime_ns) and known[3]:
+            local_md5 = known[3]
+        else:
+            local_md5 = file_md5(local_path)
+        remote_key = f"{folder_path}/{name}"
+        found = remote.get(name)
+        
+        if found is None:
+            report["new"].append(name)
+            if not dry_run and known is not None:
+                forget_remote_file(local_path)
+        elif found.get('md5Checksum') != local_md5:
+            report["changed"].append(name)
+            if not dry_run:
+                # Point the record at the Drive copy so the upload replaces it
+                record_remote_file(local_path, remote_key, None, None, None, found['id'], found.get('md5Checksum'))
+        else:
+            report["unchanged"].append(name)
+            if not dry_run and (known is None or known[4] != found['id'] or known[1:3] != (stat.st_size, stat.st_mtime_ns)):
+                record_remote_file(local_path, remote_key, stat.st_size, stat.st_mtime_ns,
+                                   local_md5, found['id'], found.get('md5Checksum'))
+            continue
+        to_upload.append((path, f"{remote_dir}/{name}" if remote_dir else name))
+    
+    local_names = {name for name, _ in local_files}
+    report["remote_only"] = sorted(name for name in remote if name not in local_names)
+    
+    if dry_run:
+        for line in format_sync_report(report):
+            Logger.info(f"CPD: {line}")
+    elif to_upload:
+        result = upload_many(to_upload, max_workers)
+        report["uploaded"] = len(result["uploaded"])
+        report["failed"] = result["failed"]
+    
+    Logger.info(f"CPD: Reconciled {folder_path}: {len(report['new'])} new, {len(report['changed'])} changed, "
+                f"{len(report['unchanged'])} unchanged, {len(report['remote_only'])} only on Drive")
+    return report
+
+def format_sync_report(report):
+    """Diff-style lines for a reconcile_folder() report"""
+    lines = [f"+ {name}" for name in report["new"]]
+    lines += [f"~ {name}" for name in report["changed"]]
+    lines += [f"? {name} (only on Drive)" for name in report["remote_only"]]
+    lines.append(f"{len(report['unchanged'])} unchanged")
+    return lines
+
 def test_drive_connection():
     """Test Google Drive connection"""
     try:
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+CPD Tracker - Fake Google Drive Server
+A local stand-in for the Drive v3 endpoints drive_upload.py uses, for
+offline tests and upload benchmarks
+
+Implements files.list (q filters on name, mimeType, parents, trashed and
+page tokens), files.create/update for folders, multipart and resumable
+uploads (including Content-Range status queries) and about.get. Latency,
+a bandwidth cap and a random error rate can be injected.
+
+Usage:
+    python fake_drive.py --port 8765 --latency 0.05 --bandwidth 1000000 --error-rate 0.01
+    CPD_DRIVE_ENDPOINT=http://127.0.0.1:8765/ python main.py
+"""
+
+import argparse
+import email
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Fake server configuration
+STORAGE_LIMIT = 15 * 1024 ** 3  # Reported by about.get, like a free account
+DEFAULT_PAGE_SIZE = 100
+
+class FakeDriveState:
+    """Files and open upload sessions held by one fake server"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = {}
+        self.sessions = {}
+        self.requests = []
+        self._ids = itertools.count(1)
+
+    def new_id(self, prefix):
+        return f"{prefix}{next(self._ids)}"
+
+    def store(self, metadata, content=None, file_id=None):
+        """Create (or, with file_id, update) a file and return its resource"""
+        with self.lock:
+            if file_id is None:
+                file_id = self.new_id("file-")
+                resource = {"id": file_id, "name": "untitled", "mimeType": "application/octet-stream",
+                            "parents": [], "trashed": False}
+                self.files[file_id] = resource
+            else:
+                resource = self.files[file_id]
+            resource.update({key: value for key, value in metadata.items() if key != "id"})
+            if content is not None:
+                resource["content"] = bytes(content)
+                resource["size"] = str(len(content))
+                resource["md5Checksum"] = hashlib.md5(content).hexdigest()
+            return resource
+
+    def query(self, q):
+        """Files matching a Drive q string (the subset drive_upload sends)"""
+        clauses = [clause.strip() for clause in re.split(r"\s+and\s+", q)] if q else []
+        with self.lock:
+            matches = list(self.files.values())
+        for clause in clauses:
+            field = re.fullmatch(r"(name|mimeType)\s*=\s*'((?:[^'\\]|\\.)*)'", clause)
+            parent = re.fullmatch(r"'([^']*)'\s+in\s+parents", clause)
+            trashed = re.fullmatch(r"trashed\s*=\s*(true|false)", clause)
+            if field:
+                value = re.sub(r"\\(.)", r"\1", field.group(2))
+                matches = [f for f in matches if f.get(field.group(1)) == value]
+            elif parent:
+                matches = [f for f in matches if parent.group(1) in f.get("parents", [])]
+            elif trashed:
+                matches = [f for f in matches if f.get("trashed", False) == (trashed.group(1) == "true")]
+            else:
+                raise ValueError(f"Unsupported query clause: {clause}")
+        return sorted(matches, key=lambda f: f["id"])
+
+def public(resource):
+    """A file resource as the API returns it (without the stored bytes)"""
+    return {key: value for key, value in resource.items() if key != "content"}
+
+class FakeDriveHandler(BaseHTTPRequestHandler):
+    """Routes Drive v3 requests to the server's FakeDriveState"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    # Fault injection and transfer shaping
+    def _throttle(self, nbytes):
+        bandwidth = self.server.bandwidth
+        if bandwidth:
+            time.sleep(nbytes / bandwidth)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        self._throttle(len(body))
+        return body
+
+    def _send(self, status, body=None, headers=None):
+        payload = b"" if body is None else json.dumps(body).encode("utf-8")
+        self._throttle(len(payload))
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if payload:
+            self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, status, message):
+        self._send(status, {"error": {"code": status, "message": message,
+                                      "errors": [{"message": message, "reason": "fake"}]}})
+
+    def _handle(self, method):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        body = self._read_body()
+        state = self.server.state
+        with state.lock:
+            state.requests.append((method, url.path, params.get("uploadType")))
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if self.server.error_rate and self.server.random.random() < self.server.error_rate:
+            return self._error(503, "Injected backend error")
+
+        try:
+            route = self._route(method, url.path, params)
+            if route is None:
+                return self._error(404, f"Unknown endpoint: {method} {url.path}")
+            return route(params, body)
+        except KeyError as e:
+            return self._error(404, f"File not found: {e.args[0]}")
+        except ValueError as e:
+            return self._error(400, str(e))
+
+    def _route(self, method, path, params):
+        upload = params.get("uploadType")
+        self.file_id = None  # Handlers are reused across keep-alive requests
+        if path.endswith("/about") and method == "GET":
+            return self._about
+        if path.endswith("/files") and method == "GET":
+            return self._list
+        if path.endswith("/files") and method == "POST":
+            return self._upload_start if upload == "resumable" else self._create
+        match = re.search(r"/files/([^/]+)$", path)
+        if match and method == "PATCH":
+            self.file_id = match.group(1)
+            return self._upload_start if upload == "resumable" else self._create
+        if path.endswith("/sessions") and method == "PUT":
+            return self._upload_chunk
+        return None
+
+    def _about(self, params, body):
+        state = self.server.state
+        with state.lock:
+            usage = sum(int(f.get("size", 0)) for f in state.files.values())
+        self._send(200, {"storageQuota": {"limit": str(STORAGE_LIMIT), "usage": str(usage)}})
+
+    def _list(self, params, body):
+        files = self.server.state.query(params.get("q", ""))
+        start = int(params.get("pageToken") or 0)
+        size = int(params.get("pageSize") or DEFAULT_PAGE_SIZE)
+        page = {"files": [public(f) for f in files[start:start + size]]}
+        if start + size < len(files):
+            page["nextPageToken"] = str(start + size)
+        self._send(200, page)
+
+    def _create(self, params, body):
+        """Metadata-only create, or a multipart create/update"""
+        file_id = self.file_id
+        if file_id is not None and file_id not in self.server.state.files:
+            raise KeyError(file_id)
+        content = None
+        if params.get("uploadType") == "multipart":
+            header = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode("utf-8")
+            parts = email.message_from_bytes(header + body).get_payload()
+            metadata = json.loads(parts[0].get_payload(decode=True) or b"{}")
+            content = parts[1].get_payload(decode=True)
+        else:
+            metadata = json.loads(body or b"{}")
+        self._send(200, public(self.server.state.store(metadata, content, file_id)))
+
+    def _upload_start(self, params, body):
+        """Open a resumable session; the Location header is the session URI"""
+        state = self.server.state
+        file_id = self.file_id
+        if file_id is not None and file_id not in state.files:
+            raise KeyError(file_id)
+        session_id = state.new_id("session-")
+        with state.lock:
+            state.sessions[session_id] = {"metadata": json.loads(body or b"{}"), "file_id": file_id,
+                                          "data": bytearray(), "result": None}
+        host = self.headers.get("Host")
+        self._send(200, headers={"Location": f"http://{host}/upload/drive/v3/sessions?upload_id={session_id}"})
+
+    def _upload_chunk(self, params, body):
+        """Append a chunk (or answer a 'bytes */total' status query)"""
+        state = self.server.state
+        session = state.sessions.get(params.get("upload_id"))
+        if session is None:
+            return self._error(404, "Upload session expired")
+        if session["result"] is not None:
+            return self._send(200, session["result"])
+
+        content_range = self.headers.get("Content-Range", "")
+        match = re.fullmatch(r"bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)", content_range.strip())
+        if match is None:
+            raise ValueError(f"Bad Content-Range: {content_range}")
+        if match.group(1) is not None:
+            start = int(match.group(1))
+            if start != len(session["data"]):
+                # Keep only what was confirmed; the client resends from there
+                del session["data"][start:]
+            session["data"].extend(body)
+
+        total = match.group(3)
+        if total != "*" and len(session["data"]) >= int(total):
+            resource = state.store(session["metadata"], session["data"], session["file_id"])
+            session["result"] = public(resource)
+            return self._send(200, session["result"])
+
+        received = len(session["data"])
+        headers = {"Range": f"bytes=0-{received - 1}"} if received else {}
+        self._send(308, headers=headers)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+class FakeDriveServer(ThreadingHTTPServer):
+    """Threaded fake Drive server.
+
+    latency is seconds added to every request, bandwidth caps body
+    transfer in bytes per second (None for unlimited) and error_rate is
+    the probability of answering any request with a 503. Every request is
+    recorded in state.requests as (method, path, uploadType).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, bandwidth=None, error_rate=0.0, seed=None):
+        super().__init__((host, port), FakeDriveHandler)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.state = FakeDriveState()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        """Serve on a background thread; returns self"""
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-drive", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Google Drive server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--bandwidth", type=int, default=None, help="bytes per second cap")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered 503")
+    args = parser.parse_args()
+
+    server = FakeDriveServer(args.host, args.port, args.latency, args.bandwidth, args.error_rate)
+    print(f"Fake Drive listening on {server.url} - point drive_upload at it with CPD_DRIVE_ENDPOINT={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
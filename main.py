@@ -11,13 +11,16 @@ from kivy.uix.checkbox import CheckBox
 from kivy.uix.scrollview import ScrollView
 from kivy.clock import Clock
 from kivy.utils import platform
-from database import insert_entry, init_db
-from backup import create_backup, schedule_backup
-from drive_upload import upload_to_drive
+from database import insert_entry, init_db, close_connections, get_entries_count, iter_entries
+from async_database import get_async_database
+from scheduler import get_scheduler, shutdown_scheduler, POLL_INTERVAL_SECONDS
+from backup import schedule_backup
+from upload_outbox import queue_upload, schedule_drain, UPLOAD_RUN_CONDITIONS
+from drive_upload import reconcile_folder
 from datetime import datetime, timedelta
 import calendar
+import functools
 import os
-import threading
 from kivy.logger import Logger
 
 # OCR functionality (optional)
@@ -47,6 +50,46 @@ except ImportError as e:
 except Exception as e:
     Logger.warning(f"OCR initialization error: {e}")
 
+# Column order of the CSV export
+EXPORT_COLUMNS = ("date_created", "date_start", "date_end", "name",
+                  "type", "description", "points", "photo")
+
+def write_csv_export(export_dir):
+    """Write all entries to a timestamped CSV file in export_dir.
+
+    Runs on the database worker. Returns (filepath, entries written), or
+    None when there is nothing to export.
+    """
+    import csv
+    
+    if not get_entries_count():
+        return None
+    
+    os.makedirs(export_dir, exist_ok=True)
+    
+    # Generate filename with timestamp
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"cpd_export_{timestamp}.csv"
+    filepath = os.path.join(export_dir, filename)
+    
+    # Write CSV file
+    with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        
+        # Write header
+        writer.writerow([
+            'Entry Date', 'Start Date', 'End Date', 'Activity Name', 
+            'Activity Type', 'Description', 'CPD Points', 'Photo'
+        ])
+        
+        # Stream rows page by page instead of loading them all
+        exported = 0
+        for entry in iter_entries(columns=EXPORT_COLUMNS):
+            writer.writerow(entry)
+            exported += 1
+    
+    return filepath, exported
+
 class CPDScreen(Screen):
     dialog = None
     camera = None
@@ -495,6 +538,7 @@ class CPDScreen(Screen):
     
     def capture_photo(self, *args):
         """Capture and save photo with OCR processing"""
+        get_scheduler().note_activity()
         if self.camera:
             # Create dedicated phone folder structure
             if platform == 'android':
@@ -537,23 +581,29 @@ class CPDScreen(Screen):
     def schedule_drive_sync(self):
         """Schedule Google Drive sync for photos and database"""
         try:
-            # Schedule sync in background thread
-            threading.Thread(target=self.sync_to_drive, daemon=True).start()
+            # Repeated requests while a sync runs collapse into one re-run. The
+            # photo is bound now: clear_form() resets photo_path long before a
+            # sync deferred until an unmetered network gets to run
+            get_scheduler().trigger("drive_sync", functools.partial(self.sync_to_drive, self.photo_path),
+                                    UPLOAD_RUN_CONDITIONS)
         except Exception as e:
             Logger.error(f"CPD: Error scheduling drive sync: {e}")
     
-    def sync_to_drive(self):
+    def sync_to_drive(self, photo_path=None):
         """Sync photos and database to Google Drive"""
         try:
-            # Import drive upload function
-            from drive_upload import upload_to_drive
-            
-            # Upload recent photo if exists
-            if self.photo_path and os.path.exists(self.photo_path):
-                upload_to_drive(self.photo_path, f"CPD_Photos/{os.path.basename(self.photo_path)}")
+            # Upload only the photos Drive does not have yet; if Drive cannot
+            # be reached, the outbox keeps the recent photo until it can
+            if photo_path and os.path.exists(photo_path):
+                try:
+                    reconcile_folder(os.path.dirname(photo_path), "CPD_Photos")
+                except Exception as e:
+                    Logger.warning(f"CPD: Photo reconciliation failed, queuing upload: {e}")
+                    queue_upload(photo_path, f"CPD_Photos/{os.path.basename(photo_path)}")
             
-            # Create and upload database backup
-            create_backup()
+            # Database backups go through the single-flight backup job, which
+            # keeps the BACKUP_INTERVAL_DAYS schedule
+            schedule_backup()
             
             Logger.info("CPD: Successfully synced to Google Drive")
         except Exception as e:
@@ -777,9 +827,12 @@ class CPDScreen(Screen):
         self.ids.photo_status.color = (0.6, 0.6, 0.6, 1)  # Gray color
         self.ids.status.text = ""
         self.photo_path = None
+        self.extracted_text = None
     
     def submit_entry(self):
         """Submit CPD entry after validation"""
+        get_scheduler().note_activity()
+        
         # Validate form
         is_valid, error_message = self.validate_form()
         if not is_valid:
@@ -795,54 +848,44 @@ class CPDScreen(Screen):
             "type": self.selected_activity_type,
             "description": self.ids.description.text,
             "photo": self.photo_path if self.photo_path else "",
-            "points": self.selected_points if self.selected_points is not None else 0
+            "points": self.selected_points if self.selected_points is not None else 0,
+            "ocr_text": self.extracted_text
         }
         
         try:
-            # Insert entry
-            insert_entry(data)
-            self.ids.status.text = "✓ Entry saved successfully!"
-            self.ids.status.color = (0.2, 0.6, 0.2, 1)  # Green color
-            
-            # Schedule Google Drive sync
-            self.schedule_drive_sync()
-            
-            # Clear form
-            Clock.schedule_once(lambda dt: self.clear_form(), 2)
-            
-            # Check if backup is needed (every 2 weeks)
-            schedule_backup()
+            # Insert entry on the database worker so slow storage never stalls the UI
+            get_async_database().submit(insert_entry, data,
+                                        on_success=self.entry_saved,
+                                        on_error=self.entry_failed)
+            self.ids.status.text = "Saving entry..."
+            self.ids.status.color = (0.6, 0.6, 0.6, 1)  # Gray color
             
         except Exception as e:
-            self.ids.status.text = f"Error: {str(e)}"
-            self.ids.status.color = (0.8, 0.2, 0.2, 1)  # Red color
-            Logger.error(f"CPD: Error saving entry: {e}")
+            self.entry_failed(e)
+    
+    def entry_saved(self, entry_id):
+        """Called on the main loop once the entry has been stored"""
+        self.ids.status.text = "✓ Entry saved successfully!"
+        self.ids.status.color = (0.2, 0.6, 0.2, 1)  # Green color
+        
+        # Schedule Google Drive sync
+        self.schedule_drive_sync()
+        
+        # Clear form
+        Clock.schedule_once(lambda dt: self.clear_form(), 2)
+        
+        # Check if backup is needed (every 2 weeks) - this reads backup_log
+        get_async_database().submit(schedule_backup)
+    
+    def entry_failed(self, error):
+        """Called on the main loop when saving an entry failed"""
+        self.ids.status.text = f"Error: {str(error)}"
+        self.ids.status.color = (0.8, 0.2, 0.2, 1)  # Red color
+        Logger.error(f"CPD: Error saving entry: {error}")
 
     def export_to_csv(self):
         """Export all CPD entries to CSV file"""
         try:
-            import csv
-            import sqlite3
-            from datetime import datetime
-            
-            # Connect to database
-            db_path = os.path.join("cpd_tracker", "cpd.db")
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            # Get all entries
-            cursor.execute("""
-                SELECT date_created, date_start, date_end, name, type, description, points, photo
-                FROM cpd_entries 
-                ORDER BY date_start DESC
-            """)
-            entries = cursor.fetchall()
-            conn.close()
-            
-            if not entries:
-                self.show_error("No entries found to export")
-                return
-            
             # Create export directory in dedicated folder
             if platform == 'android':
                 try:
@@ -853,39 +896,38 @@ class CPDScreen(Screen):
                     export_dir = os.path.join("cpd_tracker", "exports")
             else:
                 export_dir = os.path.join("cpd_tracker", "exports")
-            os.makedirs(export_dir, exist_ok=True)
-            
-            # Generate filename with timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"cpd_export_{timestamp}.csv"
-            filepath = os.path.join(export_dir, filename)
-            
-            # Write CSV file
-            with open(filepath, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                
-                # Write header
-                writer.writerow([
-                    'Entry Date', 'Start Date', 'End Date', 'Activity Name', 
-                    'Activity Type', 'Description', 'CPD Points', 'Photo'
-                ])
-                
-                # Write data
-                for entry in entries:
-                    writer.writerow(entry)
-            
-            # Show success message
-            self.show_success_dialog(f"✓ Export successful!\n\nFile saved as:\n{filename}\n\nLocation: {export_dir}\n\nTotal entries: {len(entries)}")
             
-            # Schedule Google Drive sync for export
-            try:
-                threading.Thread(target=lambda: upload_to_drive(filepath, f"CPD_Exports/{filename}"), daemon=True).start()
-            except Exception as sync_error:
-                Logger.error(f"CPD: Export sync error: {sync_error}")
+            # Query and write on the database worker
+            get_async_database().submit(write_csv_export, export_dir,
+                                        on_success=self.export_finished,
+                                        on_error=self.export_failed)
             
         except Exception as e:
-            self.show_error(f"Export failed: {str(e)}")
-            Logger.error(f"CPD: Export error: {e}")
+            self.export_failed(e)
+    
+    def export_finished(self, result):
+        """Called on the main loop once the CSV file has been written"""
+        if result is None:
+            self.show_error("No entries found to export")
+            return
+        
+        filepath, exported = result
+        filename = os.path.basename(filepath)
+        export_dir = os.path.dirname(filepath)
+        
+        # Show success message
+        self.show_success_dialog(f"✓ Export successful!\n\nFile saved as:\n{filename}\n\nLocation: {export_dir}\n\nTotal entries: {exported}")
+        
+        # Schedule Google Drive sync for export
+        try:
+            get_async_database().submit(queue_upload, filepath, f"CPD_Exports/{filename}")
+        except Exception as sync_error:
+            Logger.error(f"CPD: Export sync error: {sync_error}")
+    
+    def export_failed(self, error):
+        """Called on the main loop when the export failed"""
+        self.show_error(f"Export failed: {str(error)}")
+        Logger.error(f"CPD: Export error: {error}")
 
     def show_success_dialog(self, message):
         """Show success dialog"""
@@ -957,6 +999,23 @@ class CPDApp(App):
         os.makedirs(exports_dir, exist_ok=True)
         
         Logger.info(f"CPD: Created app directories in {app_dir}")
+        
+        # Resume uploads left in the outbox by the last session, then keep
+        # re-checking background jobs waiting for idle/charging/unmetered
+        schedule_drain()
+        Clock.schedule_interval(self.poll_background_jobs, POLL_INTERVAL_SECONDS)
+    
+    def poll_background_jobs(self, dt):
+        """Start deferred jobs and retry outbox uploads whose backoff has passed"""
+        schedule_drain()
+        get_scheduler().poll()
+    
+    def on_stop(self):
+        """Called when the app is closing"""
+        # Drain background jobs and queued database work, then release the connections
+        shutdown_scheduler()
+        get_async_database().shutdown()
+        close_connections()
 
 if __name__ == "__main__":
     CPDApp().run()
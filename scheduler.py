@@ -0,0 +1,165 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from kivy.logger import Logger
+from kivy.utils import platform
+
+# Scheduler configuration
+MAX_WORKERS = 2  # Backups and Drive uploads never use more threads than this
+IDLE_SECONDS = 30  # No user activity for this long counts as idle
+POLL_INTERVAL_SECONDS = 60  # How often the app re-checks deferred jobs
+
+def is_charging():
+    """True when the device is plugged in (or when it cannot be told)"""
+    try:
+        from plyer import battery
+        status = battery.status
+        return status.get('isCharging', True) is not False
+    except Exception:
+        return True
+
+def is_unmetered():
+    """True on Wi-Fi/unmetered networks (or when it cannot be told)"""
+    if platform != 'android':
+        return True
+    try:
+        from jnius import autoclass
+        PythonActivity = autoclass('org.kivy.android.PythonActivity')
+        Context = autoclass('android.content.Context')
+        activity = PythonActivity.mActivity
+        manager = activity.getSystemService(Context.CONNECTIVITY_SERVICE)
+        return not manager.isActiveNetworkMetered()
+    except Exception:
+        return True
+
+class JobScheduler:
+    """Single home for background backup and sync work.
+
+    Jobs are identified by a job type. At most one job of each type runs at
+    a time; triggers that arrive while it runs are coalesced into a single
+    re-run with the most recent function. A job may name run conditions
+    ("idle", "charging", "unmetered"); if any is not met the job is held
+    and re-checked by poll(). Work runs on a bounded thread pool and
+    shutdown() drains it.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, conditions=None):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cpd-job")
+        self._lock = threading.Lock()
+        self._running = {}
+        self._queued = {}
+        self._last_activity = 0.0
+        self._closed = False
+        self.conditions = {
+            "idle": self.is_idle,
+            "charging": is_charging,
+            "unmetered": is_unmetered,
+        }
+        if conditions:
+            self.conditions.update(conditions)
+
+    def note_activity(self):
+        """Record user activity, which resets the idle timer"""
+        self._last_activity = time.monotonic()
+
+    def is_idle(self):
+        """True when the user has not interacted for IDLE_SECONDS"""
+        return time.monotonic() - self._last_activity >= IDLE_SECONDS
+
+    def _conditions_met(self, conditions):
+        for name in conditions:
+            check = self.conditions.get(name)
+            if check is None:
+                raise ValueError(f"Unknown run condition: {name}")
+            if not check():
+                return False
+        return True
+
+    def trigger(self, job_type, func, conditions=()):
+        """Request a run of func as job_type; returns True if it started now"""
+        with self._lock:
+            if self._closed:
+                Logger.warning(f"CPD: Scheduler closed, dropping {job_type}")
+                return False
+
+            # Coalesce: keep only the latest request per job type
+            self._queued[job_type] = (func, tuple(conditions))
+            if job_type in self._running:
+                Logger.info(f"CPD: {job_type} already running, queued one re-run")
+                return False
+        return self._start(job_type)
+
+    def _start(self, job_type):
+        """Start the queued job_type unless it is running or its conditions fail"""
+        with self._lock:
+            if self._closed or job_type in self._running or job_type not in self._queued:
+                return False
+            func, conditions = self._queued[job_type]
+
+        if not self._conditions_met(conditions):
+            Logger.info(f"CPD: Deferring {job_type} until {', '.join(conditions)}")
+            return False
+
+        with self._lock:
+            if self._closed or job_type in self._running or job_type not in self._queued:
+                return False
+            # Run the newest request, even if it arrived during the check
+            func, _ = self._queued.pop(job_type)
+            self._running[job_type] = self._pool.submit(self._run, job_type, func)
+        return True
+
+    def _run(self, job_type, func):
+        try:
+            func()
+        except Exception as e:
+            Logger.error(f"CPD: Background job {job_type} failed: {e}")
+        finally:
+            with self._lock:
+                self._running.pop(job_type, None)
+            # A trigger that arrived meanwhile runs once more now
+            self._start(job_type)
+
+    def poll(self):
+        """Start deferred jobs whose run conditions are now met"""
+        with self._lock:
+            waiting = [job_type for job_type in self._queued if job_type not in self._running]
+        for job_type in waiting:
+            self._start(job_type)
+
+    def is_running(self, job_type):
+        with self._lock:
+            return job_type in self._running
+
+    def pending(self):
+        """Job types waiting for their run conditions or a re-run"""
+        with self._lock:
+            return sorted(self._queued)
+
+    def shutdown(self, wait=True):
+        """Stop accepting work, drop deferred jobs and drain running ones"""
+        with self._lock:
+            self._closed = True
+            dropped = sorted(self._queued)
+            self._queued.clear()
+        if dropped:
+            Logger.info(f"CPD: Dropping deferred jobs on shutdown: {', '.join(dropped)}")
+        self._pool.shutdown(wait=wait)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Return the process-wide scheduler, creating it on first use"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = JobScheduler()
+        return _scheduler
+
+def shutdown_scheduler(wait=True):
+    """Drain and stop the process-wide scheduler (App.on_stop)"""
+    global _scheduler
+    with _scheduler_lock:
+        scheduler, _scheduler = _scheduler, None
+    if scheduler is not None:
+        scheduler.shutdown(wait)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+CPD Tracker - Async Database Tests
+Checks that async_database.py runs calls off the calling thread
+"""
+
+import os
+import sys
+import threading
+import time
+sys.path.insert(0, os.path.dirname(__file__))
+
+from kivy.clock import Clock
+import async_database
+from async_database import AsyncDatabase
+
+def test_runs_on_worker_thread():
+    """Calls execute on the worker, not the submitting thread"""
+    worker = AsyncDatabase()
+    thread_name = worker.submit(lambda: threading.current_thread().name).result(timeout=5)
+
+    assert thread_name == "cpd-db-worker"
+    worker.shutdown()
+    print("✓ Calls run on the database worker")
+
+def test_callbacks_on_main_loop():
+    """on_success/on_error are delivered through the Kivy Clock"""
+    worker = AsyncDatabase()
+    results = []
+
+    worker.submit(lambda: 42, on_success=results.append).result(timeout=5)
+    future = worker.submit(lambda: 1 / 0, on_error=results.append)
+    worker.shutdown()
+
+    assert isinstance(future.exception(), ZeroDivisionError)
+    assert results == []  # nothing runs until the main loop ticks
+    Clock.tick()
+    assert results[0] == 42 and isinstance(results[1], ZeroDivisionError)
+    print("✓ Callbacks delivered on the main loop")
+
+def test_bounded_queue():
+    """A full queue rejects new work instead of growing without limit"""
+    worker = AsyncDatabase(max_pending=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    worker.submit(lambda: (started.set(), release.wait()))
+    started.wait(timeout=5)
+    worker.submit(lambda: None)
+
+    begin = time.monotonic()
+    try:
+        worker.submit(lambda: None)
+        assert False, "queue accepted more than max_pending calls"
+    except RuntimeError:
+        pass
+    assert time.monotonic() - begin < 0.5  # rejected without blocking the caller
+
+    release.set()
+    worker.shutdown()
+    print("✓ Queue is bounded")
+
+def test_unobserved_errors_logged():
+    """A failing call submitted without on_error is still logged"""
+    logged = []
+
+    class Recorder:
+        @staticmethod
+        def error(message):
+            logged.append(message)
+
+    worker = AsyncDatabase()
+    original, async_database.Logger = async_database.Logger, Recorder
+    try:
+        def broken():
+            return 1 / 0
+        future = worker.submit(broken)
+        worker.shutdown()
+        assert isinstance(future.exception(), ZeroDivisionError)
+    finally:
+        async_database.Logger = original
+    assert len(logged) == 1 and "broken" in logged[0]
+    print("✓ Fire-and-forget errors logged")
+
+if __name__ == "__main__":
+    test_runs_on_worker_thread()
+    test_callbacks_on_main_loop()
+    test_bounded_queue()
+    test_unobserved_errors_logged()
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+CPD Tracker - Backup Tests
+Exercises backup.py against throwaway database, photo and backup folders
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import zipfile
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(__file__))
+
+import backup
+import database
+from test_database import sample_entry
+
+def use_temp_dirs(photos=0):
+    """Point database.py and backup.py at fresh temporary folders"""
+    temp_dir = tempfile.mkdtemp(prefix="cpd_backup_test_")
+    database.set_database_path(os.path.join(temp_dir, "cpd.db"))
+    database.init_db()
+    backup.BACKUP_DIR = os.path.join(temp_dir, "backups")
+    backup.PHOTOS_DIR = os.path.join(temp_dir, "photos")
+
+    os.makedirs(backup.PHOTOS_DIR)
+    for i in range(photos):
+        with open(os.path.join(backup.PHOTOS_DIR, f"cpd_photo_{i}.png"), "wb") as f:
+            f.write(os.urandom(2048))
+    return temp_dir
+
+def read_snapshot(zip_path):
+    """Open the database stored in a backup archive"""
+    extract_dir = tempfile.mkdtemp(prefix="cpd_backup_extract_")
+    with zipfile.ZipFile(zip_path) as zipf:
+        zipf.extract("cpd.db", extract_dir)
+    return sqlite3.connect(os.path.join(extract_dir, "cpd.db"))
+
+def test_snapshot_includes_uncheckpointed_writes():
+    """The archived database holds every committed entry, even from the WAL"""
+    use_temp_dirs(photos=2)
+    database.insert_entries(sample_entry() for _ in range(10))
+
+    zip_path, entries_count = backup.create_backup()
+    assert entries_count == 10
+
+    conn = read_snapshot(zip_path)
+    assert conn.execute("SELECT COUNT(*) FROM cpd_entries").fetchone()[0] == 10
+    assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    conn.close()
+    print("✓ Snapshot is complete and consistent")
+
+def test_snapshot_during_writes():
+    """Backing up while another thread inserts never yields a torn copy"""
+    use_temp_dirs()
+    database.insert_entries(sample_entry() for _ in range(200))
+    stop = threading.Event()
+
+    def writer():
+        while not stop.is_set():
+            database.insert_entry(sample_entry())
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        zip_path, entries_count = backup.create_backup()
+    finally:
+        stop.set()
+        thread.join()
+
+    conn = read_snapshot(zip_path)
+    assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    assert conn.execute("SELECT COUNT(*) FROM cpd_entries").fetchone()[0] == entries_count
+    conn.close()
+    print("✓ Snapshot consistent under concurrent writes")
+
+def test_backup_streams_without_staging():
+    """Photos go straight into the zip and no staging folder is left behind"""
+    use_temp_dirs(photos=3)
+    os.makedirs(os.path.join(backup.PHOTOS_DIR, "2025"))
+    with open(os.path.join(backup.PHOTOS_DIR, "2025", "nested.png"), "wb") as f:
+        f.write(b"png" * 1000)
+
+    zip_path, _ = backup.create_backup()
+
+    assert os.listdir(backup.BACKUP_DIR) == [os.path.basename(zip_path)]
+    with zipfile.ZipFile(zip_path) as zipf:
+        names = zipf.namelist()
+        assert names[0] == "cpd.db"
+        assert sorted(n for n in names if n.startswith("photos/")) == ["photos/2025/nested.png", "photos/cpd_photo_0.png",
+                                     "photos/cpd_photo_1.png", "photos/cpd_photo_2.png"]
+        with open(os.path.join(backup.PHOTOS_DIR, "cpd_photo_1.png"), "rb") as f:
+            assert zipf.read("photos/cpd_photo_1.png") == f.read()
+    print("✓ Backup streamed without a staging folder")
+
+def read_tree(root):
+    """Map relative path -> bytes for every file under root"""
+    tree = {}
+    for dirpath, _, files in os.walk(root):
+        for file in files:
+            path = os.path.join(dirpath, file)
+            with open(path, "rb") as f:
+                tree[os.path.relpath(path, root)] = f.read()
+    return tree
+
+def test_incremental_backup_chain():
+    """Incremental archives hold only changes and the chain restores everything"""
+    use_temp_dirs(photos=4)
+
+    full_zip, _ = backup.create_backup(backup.BACKUP_MODE_AUTO)
+    with zipfile.ZipFile(full_zip) as zipf:
+        assert backup.read_backup_manifest(zipf)["kind"] == "full"
+        assert len([n for n in zipf.namelist() if n.startswith("photos/")]) == 4
+
+    # Change one photo, add one, delete one
+    with open(os.path.join(backup.PHOTOS_DIR, "cpd_photo_0.png"), "ab") as f:
+        f.write(b"edited")
+    with open(os.path.join(backup.PHOTOS_DIR, "cpd_photo_new.png"), "wb") as f:
+        f.write(b"new photo")
+    os.remove(os.path.join(backup.PHOTOS_DIR, "cpd_photo_3.png"))
+
+    incremental_zip, _ = backup.create_backup(backup.BACKUP_MODE_AUTO)
+    with zipfile.ZipFile(incremental_zip) as zipf:
+        manifest = backup.read_backup_manifest(zipf)
+        assert manifest["kind"] == "incremental"
+        assert sorted(n for n in zipf.namelist() if n.startswith("photos/")) == [
+            "photos/cpd_photo_0.png", "photos/cpd_photo_new.png"]
+        assert manifest["photos"]["photos/cpd_photo_1.png"]["archive"] == os.path.basename(full_zip)
+        assert "photos/cpd_photo_3.png" not in manifest["photos"]
+
+    restore_dir = tempfile.mkdtemp(prefix="cpd_backup_restore_")
+    assert backup.rebuild_from_chain(incremental_zip, restore_dir) == 4
+    assert read_tree(os.path.join(restore_dir, "photos")) == read_tree(backup.PHOTOS_DIR)
+    assert os.path.exists(os.path.join(restore_dir, "cpd.db"))
+
+    # Old archives that the chain still needs survive cleanup
+    backup.cleanup_old_backups(daily=1, weekly=0, monthly=0)
+    assert os.path.exists(full_zip)
+    print("✓ Incremental chain archives changes only and restores fully")
+
+def test_concurrent_backups_never_collide():
+    """Backups started together get distinct archives that both verify"""
+    use_temp_dirs(photos=3)
+    os.makedirs(backup.BACKUP_DIR)
+    first = backup.reserve_archive_path("20250101_000000")
+    assert backup.reserve_archive_path("20250101_000000") != first  # .partial claims the name
+    os.remove(first + ".partial")
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(backup.create_backup(backup.BACKUP_MODE_FULL)))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    paths = [zip_path for zip_path, _ in results]
+    assert len(set(paths)) == 2
+    assert all(backup.verify_backup(path, record=False)[0] for path in paths)
+    print("✓ Concurrent backups run one at a time")
+
+def test_chain_length_forces_full_backup():
+    """A long chain, or a missing link, triggers a periodic full backup"""
+    use_temp_dirs(photos=1)
+    backup.create_backup()
+    manifest = database.get_photo_manifest()
+    assert backup.choose_backup_mode(manifest) == backup.BACKUP_MODE_INCREMENTAL
+
+    fake = {f"photos/{i}.png": (1, 1, "x", f"backup_{i}.zip") for i in range(backup.MAX_BACKUP_CHAIN)}
+    assert backup.choose_backup_mode(fake) == backup.BACKUP_MODE_FULL
+
+    os.remove(os.path.join(backup.BACKUP_DIR, next(iter(manifest.values()))[3]))
+    assert backup.choose_backup_mode(manifest) == backup.BACKUP_MODE_FULL
+    print("✓ Full backup taken when the chain is long or broken")
+
+def test_compression_per_member():
+    """Photos are stored as-is while the database snapshot is compressed"""
+    use_temp_dirs(photos=2)
+    with open(os.path.join(backup.PHOTOS_DIR, "notes.txt"), "w") as f:
+        f.write("text " * 1000)
+
+    zip_path, _ = backup.create_backup()
+    with zipfile.ZipFile(zip_path) as zipf:
+        methods = {info.filename: info.compress_type for info in zipf.infolist()}
+        assert zipf.testzip() is None
+
+    assert methods["photos/cpd_photo_0.png"] == zipfile.ZIP_STORED
+    assert methods["photos/notes.txt"] == zipfile.ZIP_DEFLATED
+    assert methods["cpd.db"] == backup.resolve_compression(backup.DB_COMPRESSION)
+    assert backup.resolve_compression("no-such-codec") == zipfile.ZIP_DEFLATED
+
+    # Without read-ahead every photo is streamed from disk instead
+    backup.READ_AHEAD_BYTES = 0
+    try:
+        zip_path, _ = backup.create_backup(backup.BACKUP_MODE_FULL)
+    finally:
+        backup.READ_AHEAD_BYTES = 16 * 1024 * 1024
+    with zipfile.ZipFile(zip_path) as zipf:
+        assert zipf.testzip() is None
+        assert len(zipf.namelist()) == 5
+    print("✓ Compression chosen per archive member")
+
+def test_restore_backup_modes():
+    """Lazy restore swaps in the database only; full restore brings back every photo"""
+    use_temp_dirs(photos=3)
+    database.insert_entries(sample_entry() for _ in range(5))
+    zip_path, _ = backup.create_backup()
+    original = read_tree(backup.PHOTOS_DIR)
+
+    database.insert_entries(sample_entry() for _ in range(3))
+    os.remove(os.path.join(backup.PHOTOS_DIR, "cpd_photo_0.png"))
+
+    assert backup.restore_backup(zip_path) == (5, 0)
+    assert database.get_entries_count() == 5
+    assert not os.path.exists(database.DB_PATH + ".restore")
+    assert "cpd_photo_0.png" not in os.listdir(backup.PHOTOS_DIR)
+
+    # On demand: one photo comes back from the archive of the last restore
+    photo = os.path.join(backup.PHOTOS_DIR, "cpd_photo_0.png")
+    assert backup.restore_photo(photo) == photo
+    assert read_tree(backup.PHOTOS_DIR) == original
+
+    for name in os.listdir(backup.PHOTOS_DIR):
+        os.remove(os.path.join(backup.PHOTOS_DIR, name))
+    assert backup.restore_backup(zip_path, backup.RESTORE_MODE_FULL) == (5, 3)
+    assert read_tree(backup.PHOTOS_DIR) == original
+
+    # A restore waits for a running backup instead of swapping under it
+    done = threading.Event()
+    with backup._backup_lock:
+        thread = threading.Thread(target=lambda: (backup.restore_backup(zip_path), done.set()))
+        thread.start()
+        assert not done.wait(0.2)
+    thread.join(timeout=5)
+    assert done.is_set()
+    print("✓ Lazy and full restore")
+
+def test_failed_restore_keeps_database():
+    """A damaged archive database never replaces the live one"""
+    temp_dir = use_temp_dirs()
+    database.insert_entries(sample_entry() for _ in range(4))
+    bad_zip = os.path.join(temp_dir, "bad.zip")
+    with zipfile.ZipFile(bad_zip, "w") as zipf:
+        zipf.writestr("cpd.db", b"not a database" * 100)
+
+    try:
+        backup.restore_backup(bad_zip)
+        assert False, "restore should fail"
+    except sqlite3.DatabaseError:
+        pass
+    assert database.get_entries_count() == 4
+    assert not os.path.exists(database.DB_PATH + ".restore")
+    print("✓ Failed restore leaves the database untouched")
+
+def test_restore_entry_photo():
+    """A single entry's photo is restored from the chain, other files untouched"""
+    use_temp_dirs(photos=2)
+    photo = os.path.join(backup.PHOTOS_DIR, "cpd_photo_1.png")
+    entry_id = database.insert_entry(sample_entry(photo=photo))
+    backup.create_backup()
+    with open(photo, "rb") as f:
+        original = f.read()
+
+    # The next archive is incremental and does not hold the photo itself
+    with open(os.path.join(backup.PHOTOS_DIR, "cpd_photo_new.png"), "wb") as f:
+        f.write(b"new photo")
+    latest_zip, _ = backup.create_backup()
+    with open(photo, "wb") as f:
+        f.write(b"damaged")
+
+    assert backup.restore_entry_photo(entry_id, latest_zip) == photo
+    with open(photo, "rb") as f:
+        assert f.read() == original
+    assert backup.restore_entry_photo(entry_id + 1, latest_zip) is None
+    print("✓ Single entry photo restored")
+
+def rewrite_archive(zip_path, dest_path, replacements):
+    """Copy an archive, swapping the contents of some members"""
+    with zipfile.ZipFile(zip_path) as src, zipfile.ZipFile(dest_path, "w") as dst:
+        for name in src.namelist():
+            dst.writestr(name, replacements.get(name, src.read(name)))
+    return dest_path
+
+def test_verify_backup():
+    """Checksums and the embedded database are verified and the result logged"""
+    temp_dir = use_temp_dirs(photos=3)
+    database.insert_entries(sample_entry() for _ in range(5))
+    zip_path, entries_count = backup.create_backup()
+    database.log_backup(zip_path, entries_count)
+
+    with zipfile.ZipFile(zip_path) as zipf:
+        members = backup.read_backup_manifest(zipf)["members"]
+    assert sorted(members) == ["cpd.db", "photos/cpd_photo_0.png",
+                               "photos/cpd_photo_1.png", "photos/cpd_photo_2.png"]
+
+    assert backup.verify_backup(zip_path, max_workers=2) == (True, [])
+    logged = database.get_backup_log(zip_path)
+    assert logged["verify_status"] == "ok" and logged["verify_seconds"] >= 0
+
+    tampered = rewrite_archive(zip_path, os.path.join(temp_dir, "tampered.zip"),
+                               {"photos/cpd_photo_1.png": b"tampered"})
+    ok, problems = backup.verify_backup(tampered, record=False)
+    assert not ok and problems == ["photos/cpd_photo_1.png: checksum mismatch"]
+
+    broken = rewrite_archive(zip_path, os.path.join(temp_dir, "broken.zip"),
+                             {"cpd.db": b"not a database" * 100})
+    database.log_backup(broken, entries_count)
+    ok, problems = backup.verify_backup(broken)
+    assert not ok and any(p.startswith("cpd.db:") for p in problems)
+    assert database.get_backup_log(broken)["verify_status"] == "failed"
+    print("✓ Backups verified member by member")
+
+def test_unverified_backup_not_built_on():
+    """An archive that fails verification is moved aside and the manifest kept"""
+    use_temp_dirs(photos=2)
+    upload, verify = backup.upload_backup_to_drive, backup.verify_backup
+    backup.upload_backup_to_drive = lambda zip_path: True  # keep the outbox out of it
+    try:
+        assert backup.perform_backup() == (True, "completed")
+        good = backup.latest_backup()
+        manifest = database.get_photo_manifest()
+
+        with open(os.path.join(backup.PHOTOS_DIR, "cpd_photo_0.png"), "ab") as f:
+            f.write(b"edited")
+        backup.verify_backup = lambda zip_path, **kwargs: (False, ["cpd.db: corrupt"])
+        assert backup.perform_backup() == (False, "Backup failed verification")
+        assert database.get_photo_manifest() == manifest
+        assert backup.latest_backup() == good
+        failed = [name for name in os.listdir(backup.BACKUP_DIR) if name.endswith(".failed")]
+        assert len(failed) == 1
+        logged = database.get_backup_log(os.path.join(backup.BACKUP_DIR, failed[0]))
+        assert logged["status"] == "verify_failed" and logged["verify_status"] == "failed"
+
+        # The next backup still archives the photo only the bad archive held
+        backup.verify_backup = verify
+        assert backup.perform_backup()[0]
+        newest = os.path.basename(backup.latest_backup())
+        assert database.get_photo_manifest()["photos/cpd_photo_0.png"][3] == newest
+
+        # Retention after the good backup keeps the failed archive's outcome
+        logged = database.get_backup_log(os.path.join(backup.BACKUP_DIR, failed[0]))
+        assert logged is not None and logged["verify_status"] == "failed"
+    finally:
+        backup.upload_backup_to_drive, backup.verify_backup = upload, verify
+    print("✓ Unverified backup moved aside, manifest unchanged")
+
+def test_plan_retention_tiers():
+    """Daily, weekly and monthly tiers keep one archive each; the budget trims the oldest"""
+    newest = datetime(2025, 6, 30, 12, 0, 0)
+    archives = [(f"backup_{(newest - timedelta(days=d)).strftime('%Y%m%d_%H%M%S')}.zip", 100,
+                 newest - timedelta(days=d)) for d in range(120)]
+    names = [name for name, _, _ in archives]
+
+    keep, delete = backup.plan_retention(archives, daily=7, weekly=4, monthly=3, budget_bytes=10**9)
+    assert keep[:7] == names[:7]
+    assert "backup_20250531_120000.zip" in keep and "backup_20250430_120000.zip" in keep
+    assert len(keep) <= 7 + 4 + 3 and len(keep) + len(delete) == 120
+
+    # 350 bytes only fit the newest three; the protected old archive stays regardless
+    keep, _ = backup.plan_retention(archives, protected={names[-1]}, daily=7, weekly=4,
+                                    monthly=3, budget_bytes=350)
+    assert keep == names[:2] + [names[-1]]
+    print("✓ Retention tiers and byte budget")
+
+def test_apply_retention():
+    """Retention deletes archives and their log rows and reports the bytes reclaimed"""
+    use_temp_dirs()
+    os.makedirs(backup.BACKUP_DIR)
+    days = [datetime(2025, 6, 30) - timedelta(days=d) for d in range(5)]
+    for index, day in enumerate(days):
+        path = os.path.join(backup.BACKUP_DIR, f"backup_{day.strftime('%Y%m%d_%H%M%S')}.zip")
+        with open(path, "wb") as f:
+            f.write(b"x" * (1000 * (index + 1)))
+        database.log_backup(path, 0)
+    # Left behind by an archive deleted before retention existed
+    database.log_backup(os.path.join(backup.BACKUP_DIR, "backup_20240101_000000.zip"), 0)
+
+    report = backup.apply_retention(daily=2, weekly=0, monthly=0, dry_run=True)
+    assert len(report["deleted"]) == 3 and len(os.listdir(backup.BACKUP_DIR)) == 5
+
+    report = backup.apply_retention(daily=2, weekly=0, monthly=0)
+    assert report["kept"] == 2 and report["bytes_reclaimed"] == 3000 + 4000 + 5000
+    assert report["bytes_kept"] == 3000 and report["log_rows_deleted"] == 4
+    assert sorted(os.listdir(backup.BACKUP_DIR)) == ["backup_20250629_000000.zip", "backup_20250630_000000.zip"]
+    with database.get_connection_manager().write() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM backup_log").fetchone()[0] == 2
+    print("✓ Retention applied to archives and backup_log")
+
+def test_benchmark_harness():
+    """The benchmark runs every stage on a tiny dataset and reports JSON"""
+    import bench_backup
+    result = bench_backup.run_dataset("tiny", 50, 5, photo_bytes=1024)
+
+    assert result["entries"] == 50 and result["photo_bytes"] == 5 * 1024
+    assert list(result["stages"]) == ["snapshot", "backup_full", "backup_incremental", "verify",
+                                      "retention", "restore_lazy", "restore_full"]
+    assert result["stages"]["restore_full"]["output_bytes"] == 5 * 1024
+    assert result["stages"]["backup_full"]["output_bytes"] > result["stages"]["backup_incremental"]["output_bytes"]
+    json.dumps(result)
+    print("✓ Benchmark harness reports every stage")
+
+if __name__ == "__main__":
+    test_snapshot_includes_uncheckpointed_writes()
+    test_snapshot_during_writes()
+    test_backup_streams_without_staging()
+    test_incremental_backup_chain()
+    test_concurrent_backups_never_collide()
+    test_chain_length_forces_full_backup()
+    test_compression_per_member()
+    test_restore_backup_modes()
+    test_failed_restore_keeps_database()
+    test_restore_entry_photo()
+    test_verify_backup()
+    test_unverified_backup_not_built_on()
+    test_plan_retention_tiers()
+    test_apply_retention()
+    test_benchmark_harness()
+    database.close_connections()
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+CPD Tracker - Database Tests
+Exercises database.py against a throwaway database file
+"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+sys.path.insert(0, os.path.dirname(__file__))
+
+import database
+
+def use_temp_database():
+    """Point database.py at a fresh temporary database"""
+    temp_dir = tempfile.mkdtemp(prefix="cpd_test_")
+    database.set_database_path(os.path.join(temp_dir, "cpd.db"))
+    database.init_db()
+    return temp_dir
+
+def sample_entry(**overrides):
+    """Build a valid entry dict like CPDScreen.submit_entry does"""
+    data = {
+        "date": "2025-01-15 10:00:00",
+        "date_start": "2025-01-10",
+        "date_end": "2025-01-11",
+        "name": "Sample Conference",
+        "type": "Conference",
+        "description": "Sample description",
+        "photo": "",
+        "points": 5
+    }
+    data.update(overrides)
+    return data
+
+def test_wal_mode():
+    """Connections run in WAL mode with the tuned pragmas"""
+    use_temp_database()
+    manager = database.get_connection_manager()
+
+    mode = manager.read().execute("PRAGMA journal_mode").fetchone()[0]
+    assert mode == "wal"
+    print("✓ Database runs in WAL mode")
+
+def test_insert_and_read():
+    """Entries written through the writer are visible to readers"""
+    use_temp_database()
+
+    entry_id = database.insert_entry(sample_entry())
+    assert entry_id == 1
+    assert database.get_entries_count() == 1
+    assert database.get_all_entries()[0][4] == "Sample Conference"
+    print("✓ Insert and read through the connection manager")
+
+def test_reader_per_thread():
+    """Each thread gets its own read connection"""
+    use_temp_database()
+    manager = database.get_connection_manager()
+
+    readers = []
+    thread = threading.Thread(target=lambda: readers.append(manager.read()))
+    thread.start()
+    thread.join()
+
+    assert readers[0] is not manager.read()
+    assert manager.read() is manager.read()
+
+    # Readers of exited threads are closed once another thread needs one
+    for _ in range(20):
+        thread = threading.Thread(target=manager.read)
+        thread.start()
+        thread.join()
+    assert len(manager._readers) <= 2
+    print("✓ Read connections are per-thread")
+
+def test_concurrent_writes():
+    """Writers on several threads never hit 'database is locked'"""
+    use_temp_database()
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(25):
+                database.insert_entry(sample_entry())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert database.get_entries_count() == 100
+    print("✓ Concurrent writes serialised by the writer lock")
+
+def test_backup_log():
+    """log_backup and get_last_backup_date round-trip"""
+    use_temp_database()
+
+    assert database.get_last_backup_date() is None
+    database.log_backup("backup_20250101_000000.zip", 3)
+    assert database.get_last_backup_date() is not None
+    print("✓ Backup log round-trip")
+
+def test_import_has_no_side_effects():
+    """Importing database.py must not create or open any files"""
+    temp_dir = tempfile.mkdtemp(prefix="cpd_test_")
+    subprocess.run([sys.executable, "-c", "import database"], cwd=temp_dir, check=True,
+                   env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__))))
+
+    assert os.listdir(temp_dir) == []
+    print("✓ Import does no disk I/O")
+
+def test_migrates_legacy_database():
+    """A pre-migration database without points is upgraded in place"""
+    temp_dir = tempfile.mkdtemp(prefix="cpd_test_")
+    db_path = os.path.join(temp_dir, "cpd.db")
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("""CREATE TABLE cpd_entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, date_created TEXT NOT NULL,
+        date_start TEXT NOT NULL, date_end TEXT NOT NULL, name TEXT NOT NULL,
+        type TEXT NOT NULL, description TEXT NOT NULL, photo TEXT)""")
+    conn.execute("""INSERT INTO cpd_entries (date_created, date_start, date_end, name, type, description, photo)
+                    VALUES ('2024-01-01 00:00:00', '2024-01-01', '2024-01-02', 'Old', 'Course', 'Legacy', '')""")
+    conn.commit()
+    conn.close()
+
+    database.set_database_path(db_path)
+    database.init_db()
+
+    c = database.get_connection_manager().read()
+    assert c.execute("PRAGMA user_version").fetchone()[0] == database.SCHEMA_VERSION
+    assert c.execute("SELECT points FROM cpd_entries").fetchone()[0] == 0
+    assert database.get_points_summary(group_by="type") == [("Course", 1, 0)]
+    assert c.execute("SELECT start_day, end_day FROM cpd_entries").fetchone() == (
+        database.day_number("2024-01-01"), database.day_number("2024-01-02"))
+    print("✓ Legacy database migrated")
+
+def test_current_database_runs_no_ddl():
+    """Reopening an up-to-date database only reads PRAGMA user_version"""
+    use_temp_database()
+    database.close_connections()
+
+    statements = []
+    original_connect = database.ConnectionManager._connect
+
+    def traced_connect(manager):
+        conn = original_connect(manager)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    database.ConnectionManager._connect = traced_connect
+    try:
+        database.init_db()
+    finally:
+        database.ConnectionManager._connect = original_connect
+
+    assert statements == ["PRAGMA user_version"]
+    print("✓ Current schema opens without DDL")
+
+def test_keyset_pagination():
+    """Pages walk every entry once, newest first, resuming from the cursor"""
+    use_temp_database()
+    for day in range(1, 11):
+        database.insert_entry(sample_entry(date_start=f"2025-02-{day:02d}"))
+        database.insert_entry(sample_entry(date_start=f"2025-02-{day:02d}", type="Course"))
+
+    rows, cursor = database.get_entries_page(page_size=7)
+    assert len(rows) == 7 and cursor is not None
+
+    streamed = list(database.iter_entries(page_size=7))
+    assert [row[0] for row in streamed] == [row[0] for row in database.get_all_entries()]
+    assert len(streamed) == 20 and len({row[0] for row in streamed}) == 20
+    assert [row[2] for row in streamed] == sorted((row[2] for row in streamed), reverse=True)
+
+    resumed = list(database.iter_entries(page_size=7, after=cursor))
+    assert resumed == streamed[7:]
+    print("✓ Keyset pagination streams all entries")
+
+def test_filtered_stream():
+    """Type and date-range filters are applied in SQL"""
+    use_temp_database()
+    for day in range(1, 11):
+        database.insert_entry(sample_entry(date_start=f"2025-03-{day:02d}", type="Course" if day % 2 else "Paper"))
+
+    rows = list(database.iter_entries(page_size=2, entry_type="Course",
+                                      start_date="2025-03-03", end_date="2025-03-07",
+                                      columns=("date_start", "type")))
+    assert rows == [("2025-03-07", "Course"), ("2025-03-05", "Course"), ("2025-03-03", "Course")]
+
+    plan = database.get_connection_manager().read().execute(
+        """EXPLAIN QUERY PLAN SELECT id FROM cpd_entries WHERE type = ?
+           ORDER BY start_day DESC, id DESC""", ("Course",)).fetchall()
+    assert any("idx_type_start_day" in row[-1] for row in plan)
+    assert not any("TEMP B-TREE" in row[-1] for row in plan)
+    print("✓ Filtered stream served by the composite index")
+
+def test_bulk_insert():
+    """insert_entries streams batches in one transaction and returns ids"""
+    use_temp_database()
+    database.insert_entry(sample_entry())
+
+    rows = (sample_entry(name=f"Imported {i}", date=None, photo=None, points=None) for i in range(25))
+    ids = database.insert_entries(rows, batch_size=10)
+    assert ids == list(range(2, 27))
+
+    c = database.get_connection_manager().read()
+    assert c.execute("SELECT name FROM cpd_entries WHERE id = 26").fetchone()[0] == "Imported 24"
+    print("✓ Bulk insert returns assigned ids")
+
+def test_bulk_insert_rolls_back():
+    """One invalid row rejects the whole import"""
+    use_temp_database()
+
+    rows = [sample_entry() for _ in range(5)] + [sample_entry(date_end="2025-01-01")]
+    try:
+        database.insert_entries(rows, batch_size=2)
+        assert False, "invalid row was accepted"
+    except ValueError as e:
+        assert "Entry 5" in str(e)
+
+    assert database.get_entries_count() == 0
+    print("✓ Invalid bulk import rolled back")
+
+def test_points_summary_tracks_changes():
+    """Triggers keep points_summary equal to a full scan of cpd_entries"""
+    use_temp_database()
+    database.insert_entries([
+        sample_entry(date_start="2025-01-10", date_end="2025-01-10", type="Course", points=3),
+        sample_entry(date_start="2025-01-20", date_end="2025-01-20", type="Course", points=2),
+        sample_entry(date_start="2025-02-05", date_end="2025-02-05", type="Paper", points=4),
+        sample_entry(date_start="2026-01-05", date_end="2026-01-05", type="Paper", points=1),
+    ])
+
+    assert database.get_points_summary(group_by="type") == [("Course", 2, 5), ("Paper", 2, 5)]
+    assert database.get_points_summary("2025-01-01", "2025-12-31", group_by=None) == [(3, 9)]
+    assert database.get_points_summary("2025-02", "2025-02", group_by="month") == [(2025, 2, 1, 4)]
+
+    with database.get_connection_manager().write() as conn:
+        conn.execute("UPDATE cpd_entries SET type = 'Paper', points = 10 WHERE id = 1")
+        conn.execute("DELETE FROM cpd_entries WHERE id = 4")
+
+    assert database.get_points_summary(group_by="month_type") == [
+        (2025, 1, "Course", 1, 2), (2025, 1, "Paper", 1, 10), (2025, 2, "Paper", 1, 4)]
+    print("✓ Points summary maintained by triggers")
+
+def test_full_text_search():
+    """search() ranks entries by name, description and OCR text"""
+    use_temp_database()
+    database.insert_entries([
+        sample_entry(name="Royal College Webinar", description="Airway management"),
+        sample_entry(name="Ward teaching", description="Sepsis update from the Royal College"),
+        sample_entry(name="Certificate", description="Scanned", ocr_text="Awarded by Résumé Institute"),
+    ])
+
+    results = database.search("royal coll")
+    assert [entry_id for entry_id, _ in results] == [1, 2]
+    assert "[Royal]" in results[0][1]
+
+    assert [entry_id for entry_id, _ in database.search("resume")] == [3]
+    assert database.search('"unbalanced (quote') == []
+
+    with database.get_connection_manager().write() as conn:
+        conn.execute("UPDATE cpd_entries SET name = 'Renamed' WHERE id = 1")
+        conn.execute("DELETE FROM cpd_entries WHERE id = 3")
+    assert [entry_id for entry_id, _ in database.search("royal")] == [2]
+    assert database.search("resume") == []
+    print("✓ Full-text search kept in sync by triggers")
+
+def test_integer_date_columns():
+    """Shadow day numbers are written on insert and follow date edits"""
+    use_temp_database()
+    entry_id = database.insert_entry(sample_entry(date_start="2025-01-10", date_end="2025-01-12"))
+
+    c = database.get_connection_manager().read()
+    row = c.execute("SELECT start_day, end_day, created_ts FROM cpd_entries WHERE id = ?", (entry_id,)).fetchone()
+    assert row == (database.day_number("2025-01-10"), database.day_number("2025-01-12"),
+                   database.epoch_seconds("2025-01-15 10:00:00"))
+    assert database.day_to_date(row[0]) == "2025-01-10"
+
+    with database.get_connection_manager().write() as conn:
+        conn.execute("UPDATE cpd_entries SET date_start = '2025-01-11' WHERE id = ?", (entry_id,))
+    assert c.execute("SELECT start_day FROM cpd_entries").fetchone()[0] == database.day_number("2025-01-11")
+
+    plan = c.execute("""EXPLAIN QUERY PLAN SELECT id FROM cpd_entries WHERE start_day >= ?
+                        ORDER BY start_day DESC, id DESC""", (0,)).fetchall()
+    assert any("idx_start_day" in row[-1] for row in plan)
+    print("✓ Integer date columns maintained and indexed")
+
+def test_last_backup_timestamp():
+    """The latest completed backup is found by its integer timestamp"""
+    use_temp_database()
+    assert database.get_last_backup_timestamp() is None
+
+    database.log_backup("backup_a.zip", 1, status="local_only")
+    assert database.get_last_backup_timestamp() is None
+
+    database.log_backup("backup_b.zip", 1)
+    timestamp = database.get_last_backup_timestamp()
+    assert abs(timestamp - time.time()) < 5
+    assert database.get_last_backup_date() == datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+    print("✓ Last backup read from backup_ts")
+
+def test_last_backup_memoized():
+    """The backup-due check is answered from memory and app_metadata, not backup_log"""
+    use_temp_database()
+    database.log_backup("backup_a.zip", 1)
+    timestamp = database.get_last_backup_timestamp()
+
+    statements = []
+    database.get_connection_manager().read().set_trace_callback(statements.append)
+    for _ in range(5):
+        assert database.get_last_backup_timestamp() == timestamp
+    assert statements == []
+
+    # Migration 8 seeds app_metadata from the existing log
+    with database.get_connection_manager().write() as conn:
+        conn.execute("DELETE FROM app_metadata")
+        conn.execute("DELETE FROM schema_version WHERE version >= 8")
+        conn.execute("PRAGMA user_version = 7")
+    database.close_connections()
+    database.init_db()
+    assert database.get_last_backup_timestamp() == timestamp
+    print("✓ Last backup time memoized")
+
+def test_read_cache_invalidation():
+    """Cached reads are dropped only by writes to the tables they read"""
+    use_temp_database()
+    database.insert_entry(sample_entry())
+    database.clear_cache()
+    before = database.get_cache_stats()
+
+    assert database.get_entries_count() == 1
+    assert database.get_entries_count() == 1
+    assert database.get_entries_page(start_date="2025-01-01")[0] == database.get_entries_page(start_date="2025-01-01")[0]
+    stats = database.get_cache_stats()
+    assert stats["hits"] - before["hits"] == 2
+    assert stats["misses"] - before["misses"] == 2
+
+    # A backup_log write leaves the entry results cached...
+    database.log_backup("backup_c.zip", 1)
+    assert database.get_cache_stats()["size"] == 2
+
+    # ...an entry write drops them, and the next read sees the new row
+    database.insert_entry(sample_entry())
+    assert database.get_cache_stats()["size"] == 0
+    assert database.get_entries_count() == 2
+
+    # Writes that do not declare their tables invalidate everything
+    with database.get_connection_manager().write() as conn:
+        conn.execute("DELETE FROM cpd_entries")
+    assert database.get_entries_count() == 0
+    print("✓ Read cache invalidated precisely on write")
+
+def test_streaming_bypasses_cache():
+    """Exports stream past the read cache; only first pages are cached"""
+    use_temp_database()
+    database.insert_entries(sample_entry(name=f"Entry {i}") for i in range(25))
+    database.clear_cache()
+    database.get_entries_count()
+
+    assert len(list(database.iter_entries(page_size=5))) == 25
+    rows, cursor = database.get_entries_page(page_size=5)
+    database.get_entries_page(page_size=5, after=cursor)
+    assert database.get_cache_stats()["size"] == 2  # the count and the first page
+    print("✓ Streaming reads leave the cache alone")
+
+def test_failed_commit_rolls_back():
+    """A COMMIT that fails leaves the writer usable for later transactions"""
+    def migrate(conn):
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("CREATE TABLE parent (id INTEGER PRIMARY KEY)")
+        conn.execute("""CREATE TABLE child (parent_id INTEGER
+                        REFERENCES parent(id) DEFERRABLE INITIALLY DEFERRED)""")
+
+    manager = database.ConnectionManager(os.path.join(tempfile.mkdtemp(prefix="cpd_test_"), "fk.db"), migrate)
+    try:
+        # A deferred foreign key violation is only detected by COMMIT
+        with manager.write() as conn:
+            conn.execute("INSERT INTO child VALUES (1)")
+        assert False, "COMMIT should have failed"
+    except sqlite3.IntegrityError:
+        pass
+
+    assert not manager.open().in_transaction
+    with manager.write() as conn:
+        conn.execute("INSERT INTO parent VALUES (1)")
+        with manager.write() as inner:
+            inner.execute("INSERT INTO child VALUES (1)")
+    assert manager.read().execute("SELECT COUNT(*) FROM child").fetchone()[0] == 1
+    manager.close()
+    print("✓ Failed COMMIT rolled back")
+
+if __name__ == "__main__":
+    test_wal_mode()
+    test_insert_and_read()
+    test_reader_per_thread()
+    test_concurrent_writes()
+    test_backup_log()
+    test_import_has_no_side_effects()
+    test_migrates_legacy_database()
+    test_current_database_runs_no_ddl()
+    test_keyset_pagination()
+    test_filtered_stream()
+    test_bulk_insert()
+    test_bulk_insert_rolls_back()
+    test_points_summary_tracks_changes()
+    test_full_text_search()
+    test_integer_date_columns()
+    test_last_backup_timestamp()
+    test_last_backup_memoized()
+    test_read_cache_invalidation()
+    test_streaming_bypasses_cache()
+    test_failed_commit_rolls_back()
+    database.close_connections()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+CPD Tracker - Drive Upload Tests
+Runs drive_upload.py against recorded HTTP responses instead of Google Drive
+"""
+
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+sys.path.insert(0, os.path.dirname(__file__))
+
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpMockSequence
+
+import database
+import drive_upload
+from test_database import use_temp_database
+
+def use_mock_drive(responses):
+    """Install a Drive client that replays (status, body) responses in order"""
+    http = HttpMockSequence([({"status": str(status)}, json.dumps(body)) for status, body in responses])
+    drive_upload._service = build("drive", "v3", http=http)
+    return http
+
+def temp_file(name="photo.png", data=b"png"):
+    path = os.path.join(tempfile.mkdtemp(prefix="cpd_drive_test_"), name)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+def test_repeat_upload_makes_one_call():
+    """Once the client and folder IDs are cached an upload is a single request"""
+    use_temp_database()
+    http = use_mock_drive([
+        (200, {"files": []}),                  # CPD Points not found
+        (200, {"id": "root-id"}),              # ... so it is created
+        (200, {"files": [{"id": "sub-id"}]}),  # CPD_Photos found inside it
+        (200, {"id": "file-1", "size": "3"}),
+    ])
+    assert drive_upload.upload_to_drive(temp_file(), "CPD_Photos/a.png") == "file-1"
+    assert len(http.request_sequence) == 4
+    assert database.get_drive_folder_id("CPD Points/CPD_Photos") == "sub-id"
+
+    http = use_mock_drive([(200, {"id": "file-2", "size": "3"})])
+    assert drive_upload.upload_to_drive(temp_file(), "CPD_Photos/b.png") == "file-2"
+    assert len(http.request_sequence) == 1
+    assert "uploadType=multipart" in http.request_sequence[0][0]
+    assert b"sub-id" in http.request_sequence[0][2]
+    print("✓ Repeat upload is one API call")
+
+def test_deleted_folder_is_resolved_again():
+    """A 404 drops the cached folder IDs and the upload is retried once"""
+    use_temp_database()
+    database.set_drive_folder_id("CPD Points", "old-root")
+    database.set_drive_folder_id("CPD Points/CPD_Exports", "old-sub")
+    http = use_mock_drive([
+        (404, {"error": {"code": 404, "message": "File not found: old-sub"}}),
+        (200, {"files": [{"id": "root-id"}]}),
+        (200, {"files": []}),
+        (200, {"id": "sub-id"}),
+        (200, {"id": "file-1"}),
+    ])
+    assert drive_upload.upload_to_drive(temp_file("e.csv", b"a,b"), "CPD_Exports/e.csv") == "file-1"
+    assert len(http.request_sequence) == 5
+    assert database.get_drive_folder_id("CPD Points") == "root-id"
+    assert database.get_drive_folder_id("CPD Points/CPD_Exports") == "sub-id"
+    print("✓ Stale folder cache refreshed after 404")
+
+def test_remote_path_split():
+    """remote_path places files below the CPD Points folder"""
+    assert drive_upload.split_remote_path("/x/backup.zip") == ("CPD Points", "backup.zip")
+    assert drive_upload.split_remote_path("/x/e.csv", "CPD_Exports/e.csv") == ("CPD Points/CPD_Exports", "e.csv")
+    print("✓ Remote paths split into folder and name")
+
+def test_upload_many_shares_client():
+    """A batch goes up over the shared client with folders resolved once"""
+    use_temp_database()
+    database.set_drive_folder_id("CPD Points", "root-id")
+    database.set_drive_folder_id("CPD Points/CPD_Photos", "sub-id")
+    http = use_mock_drive([(200, {"id": "same-id"})] * 6)
+    paths = [temp_file(f"p{i}.png") for i in range(6)]
+
+    report = drive_upload.upload_many([(p, f"CPD_Photos/{os.path.basename(p)}") for p in paths], max_workers=3)
+    assert sorted(report["uploaded"]) == sorted(paths) and report["failed"] == {}
+    assert report["bytes"] == 6 * 3 and report["mb_per_s"] >= 0
+    assert len(http.request_sequence) == 6
+    print("✓ Batch uploaded over one client")
+
+def test_upload_many_concurrency_cap():
+    """No more than max_workers uploads run at once and failures are reported"""
+    lock = threading.Lock()
+    active = [0, 0]
+
+    def upload(path, remote_path):
+        with lock:
+            active[0] += 1
+            active[1] = max(active[1], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        if path.endswith("bad.png"):
+            raise IOError("disk error")
+        return "id-" + os.path.basename(path)
+
+    paths = [temp_file(f"p{i}.png") for i in range(10)] + [temp_file("bad.png")]
+    report = drive_upload.upload_many(paths, max_workers=3, upload=upload)
+    assert active[1] == 3
+    assert len(report["uploaded"]) == 10 and list(report["failed"].values()) == ["disk error"]
+    print("✓ Upload concurrency capped")
+
+def test_upload_many_folder_error_fails_items():
+    """A failed up-front folder lookup is reported per file, not raised"""
+    use_temp_database()
+    error = (503, {"error": {"code": 503, "message": "Backend error"}})
+    use_mock_drive([error, error])
+    path = temp_file()
+    report = drive_upload.upload_many([path], max_workers=1)
+    assert report["uploaded"] == {} and list(report["failed"]) == [path]
+    print("✓ Folder lookup failure reported per file")
+
+def test_reconcile_uploads_only_differences():
+    """One paginated listing decides what is new, changed or already on Drive"""
+    use_temp_database()
+    database.set_drive_folder_id("CPD Points", "root-id")
+    database.set_drive_folder_id("CPD Points/CPD_Photos", "sub-id")
+    local_dir = tempfile.mkdtemp(prefix="cpd_drive_sync_")
+    for name, data in (("a.png", b"same"), ("b.png", b"edited"), ("c.png", b"new")):
+        with open(os.path.join(local_dir, name), "wb") as f:
+            f.write(data)
+    listing = [
+        (200, {"files": [{"id": "id-a", "name": "a.png", "md5Checksum": hashlib.md5(b"same").hexdigest()}],
+               "nextPageToken": "page-2"}),
+        (200, {"files": [{"id": "id-b", "name": "b.png", "md5Checksum": hashlib.md5(b"old").hexdigest()},
+                         {"id": "id-z", "name": "z.png", "md5Checksum": "0"}]}),
+    ]
+
+    http = use_mock_drive(listing)
+    report = drive_upload.reconcile_folder(local_dir, "CPD_Photos", dry_run=True)
+    assert (report["new"], report["changed"], report["unchanged"], report["remote_only"]) == (
+        ["c.png"], ["b.png"], ["a.png"], ["z.png"])
+    assert drive_upload.format_sync_report(report) == ["+ c.png", "~ b.png", "? z.png (only on Drive)", "1 unchanged"]
+    assert len(http.request_sequence) == 2 and "pageToken=page-2" in http.request_sequence[1][0]
+    assert database.get_remote_files() == {}
+
+    http = use_mock_drive(listing + [(200, {"id": "id-b"}), (200, {"id": "id-c"})])
+    report = drive_upload.reconcile_folder(local_dir, "CPD_Photos", max_workers=1)
+    assert report["uploaded"] == 2 and report["failed"] == {}
+    methods = sorted(request[1] for request in http.request_sequence[2:])
+    assert methods == ["PATCH", "POST"]  # b.png replaces its copy, c.png is created
+
+    # Everything is recorded now, so re-uploading any of them is free
+    http = use_mock_drive([])
+    assert drive_upload.upload_to_drive(os.path.join(local_dir, "a.png"), "CPD_Photos/a.png") == "id-a"
+    assert drive_upload.upload_to_drive(os.path.join(local_dir, "c.png"), "CPD_Photos/c.png") == "id-c"
+    assert http.request_sequence == []
+    print("✓ Reconciliation uploads only new and changed files")
+
+def test_resumable_upload_survives_restart():
+    """An interrupted large upload resumes from the offset the server confirmed"""
+    use_temp_database()
+    database.set_drive_folder_id("CPD Points", "root-id")
+    database.set_metadata("upload_chunk_size", 256 * 1024)
+    drive_upload.RESUMABLE_THRESHOLD = 1024
+    path = temp_file("backup.zip", os.urandom(600 * 1024))
+    local_path = os.path.abspath(path)
+    try:
+        # The app is killed after the first chunk
+        http = HttpMockSequence([({"status": "200", "location": "https://upload.test/s1"}, ""),
+                                 ({"status": "308", "range": "bytes=0-262143"}, "")])
+        drive_upload._service = build("drive", "v3", http=http)
+        try:
+            drive_upload.upload_to_drive(path)
+            assert False, "upload should have been interrupted"
+        except IndexError:
+            pass
+        session = database.get_upload_session(local_path)
+        assert session[3:5] == ("https://upload.test/s1", 256 * 1024)
+
+        http = HttpMockSequence([({"status": "308", "range": "bytes=0-262143"}, ""),
+                                 ({"status": "308", "range": "bytes=0-524287"}, ""),
+                                 ({"status": "200"}, json.dumps({"id": "big-id"}))])
+        drive_upload._service = build("drive", "v3", http=http)
+        assert drive_upload.upload_to_drive(path) == "big-id"
+
+        uris = [request[0] for request in http.request_sequence]
+        assert uris == ["https://upload.test/s1"] * 3
+        assert http.request_sequence[0][3]["Content-Range"] == f"bytes */{600 * 1024}"
+        assert http.request_sequence[1][3]["Content-Range"] == f"bytes 262144-524287/{600 * 1024}"
+        assert database.get_upload_session(local_path) is None
+        assert database.get_remote_file(local_path)[4] == "big-id"
+    finally:
+        drive_upload.RESUMABLE_THRESHOLD = 5 * 1024 * 1024
+    print("✓ Resumable upload continues after a restart")
+
+def test_resumable_session_kept_on_server_error():
+    """Only 404/410 drop a saved session; other errors leave it for a retry"""
+    use_temp_database()
+    database.set_drive_folder_id("CPD Points", "root-id")
+    drive_upload.RESUMABLE_THRESHOLD = 1024
+    path = temp_file("backup.zip", os.urandom(600 * 1024))
+    local_path = os.path.abspath(path)
+    stat = os.stat(local_path)
+    try:
+        database.save_upload_session(local_path, "CPD Points/backup.zip", stat.st_size, stat.st_mtime_ns,
+                                     "https://upload.test/s1", 512 * 1024, 256 * 1024)
+        http = HttpMockSequence([({"status": "503"}, "")])
+        drive_upload._service = build("drive", "v3", http=http)
+        try:
+            drive_upload.upload_to_drive(path)
+            assert False, "upload should have failed"
+        except HttpError as e:
+            assert e.resp.status == 503
+        assert database.get_upload_session(local_path)[3:5] == ("https://upload.test/s1", 512 * 1024)
+
+        # An expired session starts a new one from byte 0
+        http = HttpMockSequence([({"status": "404"}, ""),
+                                 ({"status": "200", "location": "https://upload.test/s2"}, ""),
+                                 ({"status": "200"}, json.dumps({"id": "big-id"}))])
+        drive_upload._service = build("drive", "v3", http=http)
+        database.set_metadata("upload_chunk_size", 1024 * 1024)
+        assert drive_upload.upload_to_drive(path) == "big-id"
+        assert database.get_upload_session(local_path) is None
+    finally:
+        drive_upload.RESUMABLE_THRESHOLD = 5 * 1024 * 1024
+    print("✓ Resumable session survives server errors")
+
+def test_transport_keeps_resumable_308():
+    """Per-thread transports hand 308 replies to the resumable protocol"""
+    from google.oauth2.credentials import Credentials
+    drive_upload._credentials = Credentials(token="token")
+    try:
+        http = drive_upload._http()
+        assert 308 not in http.http.redirect_codes
+    finally:
+        drive_upload.reset_drive_service()
+    print("✓ Transport does not follow resumable 308s")
+
+def test_adaptive_chunk_size():
+    """Chunks grow on fast links and shrink on slow ones, within bounds"""
+    mib = 1024 * 1024
+    assert drive_upload.next_chunk_size(4 * mib, 4 * mib, 0.5) == 8 * mib   # fast: at most doubles
+    assert drive_upload.next_chunk_size(4 * mib, 4 * mib, 40) == 2 * mib    # slow: at most halves
+    assert drive_upload.next_chunk_size(4 * mib, 4 * mib, 5) == 4 * mib     # on target
+    assert drive_upload.next_chunk_size(256 * 1024, 1000, 10) == drive_upload.MIN_CHUNK_SIZE
+    assert drive_upload.next_chunk_size(64 * mib, 64 * mib, 1) == drive_upload.MAX_CHUNK_SIZE
+    assert drive_upload.next_chunk_size(3 * mib, 3 * mib + 1000, 5) % drive_upload.CHUNK_ALIGNMENT == 0
+    print("✓ Chunk size adapts to throughput")
+
+if __name__ == "__main__":
+    test_repeat_upload_makes_one_call()
+    test_deleted_folder_is_resolved_again()
+    test_remote_path_split()
+    test_upload_many_shares_client()
+    test_upload_many_concurrency_cap()
+    test_upload_many_folder_error_fails_items()
+    test_reconcile_uploads_only_differences()
+    test_resumable_upload_survives_restart()
+    test_resumable_session_kept_on_server_error()
+    test_transport_keeps_resumable_308()
+    test_adaptive_chunk_size()
+    database.close_connections()
@@ -4,6 +4,7 @@ import sys
 sys.path.insert(0, os.path.dirname(__file__))
 
 from main import CPDScreen
+from async_database import get_async_database
 import sqlite3
 import csv
 from datetime import datetime
@@ -17,6 +18,9 @@ def test_export():
         # Call export method
         screen.export_to_csv()
         
+        # The export runs on the database worker; wait for it to finish
+        get_async_database().submit(lambda: None).result()
+        
         # Check if export file was created
         export_dir = os.path.join("cpd_tracker", "exports")
         if os.path.exists(export_dir):
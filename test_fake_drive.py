@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+CPD Tracker - Fake Drive Tests
+Runs drive_upload.py end to end against the local fake_drive.py server
+"""
+
+import os
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(__file__))
+
+from googleapiclient.errors import HttpError
+
+import database
+import drive_upload
+import upload_outbox
+from fake_drive import FakeDriveServer
+from test_database import use_temp_database
+from test_drive_upload import temp_file
+
+def use_fake_drive(**options):
+    """Start a fake server and point drive_upload at it"""
+    use_temp_database()
+    server = FakeDriveServer(seed=1, **options).start()
+    drive_upload.set_drive_endpoint(server.url)
+    return server
+
+def stop_fake_drive(server):
+    drive_upload.set_drive_endpoint(None)
+    server.stop()
+
+def stored(server, name):
+    """Contents of the named file on the fake server"""
+    matches = [f for f in server.state.files.values() if f["name"] == name]
+    assert len(matches) == 1, f"{name}: {len(matches)} copies"
+    return matches[0].get("content")
+
+def test_upload_and_quota():
+    """Folders are created, files stored and later uploads skip the lookups"""
+    server = use_fake_drive()
+    try:
+        file_id = drive_upload.upload_to_drive(temp_file("a.png", b"first"), "CPD_Photos/a.png")
+        assert stored(server, "a.png") == b"first"
+        folder = database.get_drive_folder_id("CPD Points/CPD_Photos")
+        assert server.state.files[file_id]["parents"] == [folder]
+
+        before = len(server.state.requests)
+        drive_upload.upload_to_drive(temp_file("b.png", b"second"), "CPD_Photos/b.png")
+        assert len(server.state.requests) == before + 1
+        assert drive_upload.test_drive_connection()
+
+        quota = drive_upload.get_upload_quota_info()
+        assert quota["usage"] == len(b"first") + len(b"second")
+    finally:
+        stop_fake_drive(server)
+    print("✓ Uploads and quota work against the fake server")
+
+def test_resumable_upload():
+    """Large files go up in Content-Range chunks and arrive intact"""
+    server = use_fake_drive()
+    database.set_metadata("upload_chunk_size", 256 * 1024)
+    drive_upload.RESUMABLE_THRESHOLD = 1024
+    data = os.urandom(600 * 1024)
+    path = temp_file("backup.zip", data)
+    try:
+        drive_upload.upload_to_drive(path)
+        assert stored(server, "backup.zip") == data
+        chunks = [r for r in server.state.requests if r[0] == "PUT"]
+        assert len(chunks) == 2  # 256 KiB, then a doubled chunk on the fast local link
+        assert int(database.get_metadata("upload_chunk_size")) > 256 * 1024
+        assert database.get_upload_session(os.path.abspath(path)) is None
+    finally:
+        drive_upload.RESUMABLE_THRESHOLD = 5 * 1024 * 1024
+        stop_fake_drive(server)
+    print("✓ Resumable upload arrives intact")
+
+def test_reconcile_against_fake():
+    """A second reconcile uploads only the file that changed"""
+    server = use_fake_drive()
+    local_dir = tempfile.mkdtemp(prefix="cpd_fake_sync_")
+    for name in ("a.png", "b.png", "c.png"):
+        with open(os.path.join(local_dir, name), "wb") as f:
+            f.write(name.encode())
+    try:
+        report = drive_upload.reconcile_folder(local_dir, "CPD_Photos")
+        assert report["uploaded"] == 3
+
+        with open(os.path.join(local_dir, "b.png"), "wb") as f:
+            f.write(b"edited")
+        report = drive_upload.reconcile_folder(local_dir, "CPD_Photos")
+        assert report["changed"] == ["b.png"] and report["uploaded"] == 1
+        assert stored(server, "b.png") == b"edited"
+    finally:
+        stop_fake_drive(server)
+    print("✓ Reconcile against the fake server")
+
+def test_injected_faults():
+    """Error rate, latency and bandwidth settings shape every request"""
+    server = use_fake_drive(error_rate=1.0)
+    try:
+        try:
+            drive_upload.upload_to_drive(temp_file())
+            assert False, "upload should have failed"
+        except HttpError as e:
+            assert e.resp.status == 503
+
+        database.enqueue_upload(temp_file(), None)
+        assert upload_outbox.drain_outbox(max_workers=1) == (0, 1)
+        assert upload_outbox.outbox_status()["failing"] == 1
+    finally:
+        stop_fake_drive(server)
+
+    server = use_fake_drive(latency=0.1, bandwidth=1024 * 1024)
+    try:
+        started = time.monotonic()
+        drive_upload.upload_to_drive(temp_file("slow.zip", os.urandom(256 * 1024)))
+        # Folder lookup, folder create and the upload, plus 0.25s of body
+        assert time.monotonic() - started >= 0.3 + 0.25
+    finally:
+        stop_fake_drive(server)
+    print("✓ Injected errors, latency and bandwidth")
+
+if __name__ == "__main__":
+    test_upload_and_quota()
+    test_resumable_upload()
+    test_reconcile_against_fake()
+    test_injected_faults()
+    database.close_connections()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+CPD Tracker - Scheduler Tests
+Checks single-flight, coalescing, run conditions and shutdown in scheduler.py
+"""
+
+import os
+import sys
+import threading
+sys.path.insert(0, os.path.dirname(__file__))
+
+from scheduler import JobScheduler
+
+def test_single_flight_and_coalescing():
+    """Triggers during a run collapse into exactly one re-run of the latest job"""
+    scheduler = JobScheduler(max_workers=2)
+    release = threading.Event()
+    rerun_done = threading.Event()
+    runs = []
+
+    def slow_job():
+        runs.append("first")
+        release.wait(5)
+
+    assert scheduler.trigger("backup", slow_job) is True
+    for i in range(5):
+        assert scheduler.trigger("backup", lambda i=i: (runs.append(f"re-run {i}"), rerun_done.set())) is False
+    assert scheduler.is_running("backup")
+    assert scheduler.pending() == ["backup"]
+
+    release.set()
+    assert rerun_done.wait(5)
+    scheduler.shutdown()
+
+    assert runs == ["first", "re-run 4"]
+    print("✓ One job per type, repeated triggers coalesced")
+
+def test_deferred_until_conditions_met():
+    """A job waits for its run conditions and starts on the next poll"""
+    charging = [False]
+    scheduler = JobScheduler(conditions={"charging": lambda: charging[0]})
+    done = threading.Event()
+
+    assert scheduler.trigger("upload", done.set, conditions=("charging",)) is False
+    assert scheduler.pending() == ["upload"]
+    scheduler.poll()
+    assert not done.is_set()
+
+    charging[0] = True
+    scheduler.poll()
+    assert done.wait(5)
+    scheduler.shutdown()
+    assert scheduler.pending() == []
+    print("✓ Jobs deferred until their run conditions hold")
+
+def test_idle_condition():
+    """User activity holds back idle-only jobs"""
+    scheduler = JobScheduler()
+    scheduler.note_activity()
+    assert not scheduler.is_idle()
+    assert scheduler.trigger("backup", lambda: None, conditions=("idle",)) is False
+    scheduler.shutdown()
+    print("✓ Idle condition respects recent activity")
+
+def test_shutdown_drains_and_rejects():
+    """shutdown() waits for running jobs, drops deferred ones and refuses new work"""
+    scheduler = JobScheduler(conditions={"unmetered": lambda: False})
+    finished = []
+    started = threading.Event()
+
+    def job():
+        started.set()
+        threading.Event().wait(0.2)
+        finished.append(True)
+
+    scheduler.trigger("sync", job)
+    scheduler.trigger("upload", lambda: finished.append("never"), conditions=("unmetered",))
+    assert started.wait(5)
+    scheduler.shutdown()
+
+    assert finished == [True]
+    assert scheduler.trigger("sync", job) is False
+    print("✓ Shutdown drains running jobs")
+
+def test_failing_job_releases_slot():
+    """An exception in a job is logged and the job type can run again"""
+    scheduler = JobScheduler()
+    scheduler.trigger("backup", lambda: 1 / 0)
+    scheduler.shutdown()
+    assert not scheduler.is_running("backup")
+    print("✓ Failed jobs do not block their job type")
+
+if __name__ == "__main__":
+    test_single_flight_and_coalescing()
+    test_deferred_until_conditions_met()
+    test_idle_condition()
+    test_shutdown_drains_and_rejects()
+    test_failing_job_releases_slot()
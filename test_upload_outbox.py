@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+CPD Tracker - Upload Outbox Tests
+Checks queuing, coalescing, backoff and persistence in upload_outbox.py
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+sys.path.insert(0, os.path.dirname(__file__))
+
+import database
+import upload_outbox
+from test_database import use_temp_database
+
+def temp_file(name="photo.png"):
+    path = os.path.join(tempfile.mkdtemp(prefix="cpd_outbox_test_"), name)
+    with open(path, "wb") as f:
+        f.write(b"data")
+    return path
+
+def test_duplicates_coalesce():
+    """Five saves of one file become one upload of its latest version"""
+    use_temp_database()
+    path = temp_file()
+    for _ in range(5):
+        database.enqueue_upload(path, "CPD_Photos/photo.png")
+    assert database.get_outbox_stats()["depth"] == 1
+
+    calls = []
+    assert upload_outbox.drain_outbox(lambda *args: calls.append(args)) == (1, 0)
+    assert calls == [(path, "CPD_Photos/photo.png")]
+    assert database.get_outbox_stats()["depth"] == 0
+    print("✓ Duplicate uploads coalesced")
+
+def test_requeue_during_upload_is_kept():
+    """A file changed while it uploads is sent again afterwards"""
+    use_temp_database()
+    path = temp_file()
+    database.enqueue_upload(path)
+    calls = []
+
+    def upload(local_path, remote_path):
+        calls.append(local_path)
+        if len(calls) == 1:
+            database.enqueue_upload(path)
+
+    assert upload_outbox.drain_outbox(upload) == (2, 0)
+    assert database.get_outbox_stats()["depth"] == 0
+    print("✓ Re-queued file uploaded again")
+
+def test_failures_back_off():
+    """Failed uploads are rescheduled with jittered exponential backoff"""
+    use_temp_database()
+    database.enqueue_upload(temp_file())
+
+    def offline(*args):
+        raise ConnectionError("offline")
+
+    before = time.time()
+    assert upload_outbox.drain_outbox(offline) == (0, 1)
+    stats = database.get_outbox_stats()
+    assert stats["depth"] == 1 and stats["failing"] == 1
+    low = upload_outbox.RETRY_BASE_SECONDS / 2
+    assert low - 1 <= stats["next_attempt_in"] <= upload_outbox.RETRY_BASE_SECONDS
+    assert upload_outbox.drain_outbox(offline) == (0, 0)  # not due yet
+    assert stats["oldest_age_seconds"] <= time.time() - before + 1
+
+    rng = random.Random(7)
+    for attempts in range(1, 20):
+        delay = min(upload_outbox.RETRY_MAX_SECONDS, upload_outbox.RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+        assert delay / 2 <= upload_outbox.retry_delay(attempts, rng) <= delay
+    print("✓ Failed uploads back off")
+
+def test_outbox_survives_restart():
+    """Pending uploads are still queued after the database is reopened"""
+    use_temp_database()
+    path = temp_file()
+    database.enqueue_upload(path, "CPD_Exports/e.csv")
+    database.close_connections()
+    database.init_db()
+
+    assert [row[1:3] for row in database.get_due_uploads()] == [(path, "CPD_Exports/e.csv")]
+    print("✓ Outbox persists across restarts")
+
+def test_missing_file_dropped():
+    """Rows for files deleted before upload are removed without an attempt"""
+    use_temp_database()
+    path = temp_file()
+    database.enqueue_upload(path)
+    os.remove(path)
+    assert upload_outbox.drain_outbox(lambda *args: 1 / 0) == (0, 0)
+    assert database.get_outbox_stats()["depth"] == 0
+    print("✓ Missing files dropped from the outbox")
+
+if __name__ == "__main__":
+    test_duplicates_coalesce()
+    test_requeue_during_upload_is_kept()
+    test_failures_back_off()
+    test_outbox_survives_restart()
+    test_missing_file_dropped()
+    database.close_connections()
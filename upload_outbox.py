@@ -0,0 +1,83 @@
+import os
+import random
+import time
+from kivy.logger import Logger
+from database import enqueue_upload, get_due_uploads, complete_upload, fail_upload, get_outbox_stats
+from drive_upload import upload_to_drive, upload_many, UPLOAD_WORKERS
+from scheduler import get_scheduler
+
+# Outbox configuration
+UPLOAD_RUN_CONDITIONS = ("unmetered",)  # Drive uploads only run on unmetered networks
+RETRY_BASE_SECONDS = 30  # Delay after the first failure, doubled for each further one
+RETRY_MAX_SECONDS = 6 * 3600
+DRAIN_BATCH_SIZE = 20  # Rows fetched from the outbox per query
+
+def queue_upload(local_path, remote_path=None):
+    """Persist an upload in the outbox and wake the drain worker.
+
+    remote_path has the meaning it has for drive_upload.upload_to_drive.
+    Queuing a file that is already waiting collapses into one upload of
+    its latest contents.
+    """
+    enqueue_upload(local_path, remote_path)
+    Logger.info(f"CPD: Queued upload of {os.path.basename(local_path)}")
+    schedule_drain()
+
+def schedule_drain():
+    """Start the drain worker unless it is already running"""
+    return get_scheduler().trigger("upload_outbox", drain_outbox, UPLOAD_RUN_CONDITIONS)
+
+def retry_delay(attempts, rng=random):
+    """Seconds to wait after the given number of failed attempts.
+
+    Exponential backoff capped at RETRY_MAX_SECONDS, with "equal jitter":
+    a random half is added to half the delay, so devices that went
+    offline together do not retry in lockstep.
+    """
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1))
+    return delay / 2 + rng.uniform(0, delay / 2)
+
+def drain_outbox(upload=upload_to_drive, max_workers=UPLOAD_WORKERS):
+    """Upload every due outbox row; returns (uploaded, failed).
+
+    Each batch of due rows goes through upload_many(), max_workers at a
+    time. Successful rows are deleted, failed ones rescheduled with
+    retry_delay(). Rows whose file no longer exists are dropped.
+    """
+    uploaded = failed = 0
+    while True:
+        rows = get_due_uploads(time.time(), DRAIN_BATCH_SIZE)
+        if not rows:
+            break
+
+        batch = []
+        for row in rows:
+            upload_id, local_path, remote_path, version, attempts = row
+            if not os.path.exists(local_path):
+                Logger.warning(f"CPD: Dropping upload of missing file {local_path}")
+                complete_upload(upload_id, version)
+                continue
+            batch.append(row)
+
+        report = upload_many([(row[1], row[2] or None) for row in batch], max_workers, upload)
+        for upload_id, local_path, remote_path, version, attempts in batch:
+            if local_path in report["uploaded"]:
+                complete_upload(upload_id, version)
+                uploaded += 1
+                continue
+
+            error = report["failed"][local_path]
+            delay = retry_delay(attempts + 1)
+            fail_upload(upload_id, version, time.time() + delay, error)
+            failed += 1
+            Logger.warning(f"CPD: Upload of {os.path.basename(local_path)} failed "
+                           f"(attempt {attempts + 1}), retrying in {delay:.0f}s: {error}")
+
+    if uploaded or failed:
+        stats = get_outbox_stats()
+        Logger.info(f"CPD: Outbox drained: {uploaded} uploaded, {failed} failed, {stats['depth']} waiting")
+    return uploaded, failed
+
+def outbox_status():
+    """Queue depth and age of pending uploads, for monitoring"""
+    return get_outbox_stats()